@@ -0,0 +1,356 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures how listing templates, building choices, validating values and
+rendering the widget scale with the number of templates, using generated
+trees of templates searched by each of the filesystem, app directories and
+cached loaders.
+
+For every stage it reports the best wall time of `--repeat` runs, the number
+of Python-level filesystem calls made (``scandir``, ``listdir``, ``stat``,
+``lstat`` and ``io.open``; `DirEntry` methods which hit the disk aren't
+counted) and the peak memory allocated (from ``tracemalloc``, in a separate
+run, as tracing slows everything down).
+
+Each loader & tree is measured in its own process, so that caches and memory
+don't leak between them.
+
+    python benchmarks.py
+    python benchmarks.py --sizes=1000 --depths=3 --loaders=cached
+    python benchmarks.py --json=before.json
+    python benchmarks.py --compare=before.json
+"""
+from __future__ import absolute_import, division, print_function
+import argparse
+import io
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer
+sys.dont_write_bytecode = True
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+APP_NAME = 'templateselector_benchmark_app'
+FILES_PER_DIRECTORY = 10
+ALL_TEMPLATES = r'^bench/.+\.html$'
+SOME_TEMPLATES = r'^bench/d0/.+\.html$'
+SAMPLE_SIZE = 100
+LOADERS = {
+    'filesystem': ['django.template.loaders.filesystem.Loader'],
+    'app_directories': ['django.template.loaders.app_directories.Loader'],
+    'cached': [('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+    ])],
+}
+
+
+def get_template_names(count, depth):
+    """
+    `count` template names, `FILES_PER_DIRECTORY` to a directory, with the
+    directories nested `depth` levels deep below ``bench/``
+    """
+    directories = max(1, int(math.ceil(count / FILES_PER_DIRECTORY)))
+    fanout = max(2, int(math.ceil(directories ** (1.0 / depth))))
+    for index in range(count):
+        directory = index // FILES_PER_DIRECTORY
+        parts = ['bench']
+        for level in range(depth):
+            parts.append('d{}'.format(directory % fanout))
+            directory //= fanout
+        parts.append('t{}.html'.format(index))
+        yield '/'.join(parts)
+
+
+def generate_tree(workdir, count, depth):
+    tree = os.path.join(workdir, '{}-{}'.format(count, depth))
+    app = os.path.join(tree, APP_NAME)
+    templates = os.path.join(app, 'templates')
+    if os.path.isdir(templates):
+        return tree
+    os.makedirs(templates)
+    io.open(os.path.join(app, '__init__.py'), mode='w').close()
+    made = set()
+    for name in get_template_names(count, depth):
+        path = os.path.join(templates, *name.split('/'))
+        directory = os.path.dirname(path)
+        if directory not in made:
+            os.makedirs(directory)
+            made.add(directory)
+        with io.open(path, mode='w', encoding='utf-8') as f:
+            f.write('<p>{{ title }}</p>\n')
+    return tree
+
+
+class CallCounter(object):
+    """
+    Counts calls to the filesystem functions used when finding and loading
+    templates, by replacing them with wrappers.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def wrap(self, func):
+        def counted(*args, **kwargs):
+            self.count += 1
+            return func(*args, **kwargs)
+        return counted
+
+    def install(self):
+        from templateselector import handlers
+        targets = [(os, 'stat'), (os, 'lstat'), (os, 'listdir'), (io, 'open'),
+                   (handlers, 'scandir')]
+        if hasattr(os, 'scandir'):
+            targets.append((os, 'scandir'))
+        for module, name in targets:
+            setattr(module, name, self.wrap(getattr(module, name)))
+
+
+def configure(tree, loader):
+    import django
+    from django.conf import settings
+    sys.path.insert(0, tree)
+    sys.path.insert(0, HERE)
+    installed_apps = [
+        'django.contrib.contenttypes',
+        'django.contrib.auth',
+        'django.contrib.admin',
+        'django.contrib.staticfiles',
+        'templateselector',
+    ]
+    dirs = [os.path.join(tree, APP_NAME, 'templates')]
+    if loader == 'app_directories':
+        installed_apps.insert(0, APP_NAME)
+        dirs = []
+    settings.configure(
+        DEBUG=False,
+        SECRET_KEY='benchmarks',
+        INSTALLED_APPS=installed_apps,
+        STATIC_URL='/static/',
+        TEMPLATES=[{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'DIRS': dirs,
+            'OPTIONS': {'loaders': LOADERS[loader]},
+        }],
+    )
+    django.setup()
+
+
+def get_stages(count, depth):
+    """
+    The ``(name, setup, run)`` for each stage; `setup` isn't timed.
+    """
+    from django.core.exceptions import ValidationError
+    from django.template import engines
+    from django.test import override_settings
+    from templateselector.fields import (TemplateChoiceField,
+                                         TemplateExistsValidator,
+                                         choices_cache,
+                                         get_templates_from_loaders)
+    from templateselector.inventory import inventory
+    from templateselector.loading import compiled_templates, missing_templates
+
+    names = list(get_template_names(count, depth))
+    step = max(1, len(names) // SAMPLE_SIZE)
+    existing = names[::step][:SAMPLE_SIZE]
+    missing = ['bench/missing/t{}.html'.format(x) for x in range(SAMPLE_SIZE)]
+
+    def cold():
+        inventory.clear()
+        choices_cache.clear()
+
+    def warm():
+        cold()
+        tuple(get_templates_from_loaders())
+
+    def cold_loaders():
+        warm()
+        missing_templates.clear()
+        compiled_templates.clear()
+        for engine in engines.all():
+            for loader in engine.engine.template_loaders:
+                if hasattr(loader, 'reset'):
+                    loader.reset()
+
+    def listing():
+        return len(tuple(get_templates_from_loaders()))
+
+    def choices(match):
+        def run():
+            return len(tuple(TemplateChoiceField(match=match).choices))
+        return run
+
+    def validation():
+        validator = TemplateExistsValidator(ALL_TEMPLATES)
+        for name in existing:
+            validator(name)
+        for name in missing:
+            try:
+                validator(name)
+            except ValidationError:
+                pass
+        return len(existing) + len(missing)
+
+    def validation_from_inventory():
+        with override_settings(TEMPLATESELECTOR_VALIDATE_FROM_INVENTORY=True):
+            return validation()
+
+    def render():
+        field = TemplateChoiceField(match=SOME_TEMPLATES)
+        return len(field.widget.render('template', None))
+
+    return [
+        ('listing (cold)', cold, listing),
+        ('listing (warm)', warm, listing),
+        ('choices, all (cold)', cold, choices(ALL_TEMPLATES)),
+        ('choices, all (warm listing)', warm, choices(ALL_TEMPLATES)),
+        ('choices, prefix (cold)', cold, choices(SOME_TEMPLATES)),
+        ('validation (loading)', cold_loaders, validation),
+        ('validation (inventory)', cold_loaders, validation_from_inventory),
+        ('render, prefix (warm listing)', warm, render),
+    ]
+
+
+def run_child(tree, loader, count, depth, repeat):
+    configure(tree, loader)
+    counter = CallCounter()
+    counter.install()
+    results = []
+    for name, setup, run in get_stages(count, depth):
+        best = None
+        for attempt in range(repeat):
+            setup()
+            counter.count = 0
+            started = default_timer()
+            size = run()
+            elapsed = default_timer() - started
+            best = elapsed if best is None else min(best, elapsed)
+        calls = counter.count
+        peak = None
+        if tracemalloc is not None:
+            setup()
+            tracemalloc.start()
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        results.append({
+            'loader': loader, 'files': count, 'depth': depth, 'stage': name,
+            'size': size, 'seconds': best, 'calls': calls, 'peak': peak,
+        })
+    print(json.dumps(results))
+
+
+def run_parent(options):
+    workdir = options.workdir or tempfile.mkdtemp(prefix='templateselector-')
+    results = []
+    try:
+        for count in options.sizes:
+            for depth in options.depths:
+                sys.stderr.write("Generating {} templates, {} deep\n".format(count, depth))
+                tree = generate_tree(workdir, count, depth)
+                for loader in options.loaders:
+                    sys.stderr.write("Measuring {} loader\n".format(loader))
+                    output = subprocess.check_output([
+                        sys.executable, os.path.abspath(__file__), '--child',
+                        tree, loader, str(count), str(depth),
+                        '--repeat={}'.format(options.repeat),
+                    ])
+                    results.extend(json.loads(output.decode('utf-8').splitlines()[-1]))
+    finally:
+        if not options.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print_results(results)
+    if options.json:
+        with io.open(options.json, mode='w', encoding='utf-8') as f:
+            f.write(json.dumps(results, indent=1, ensure_ascii=False))
+    if options.compare:
+        return compare_results(results, options.compare, options.tolerance)
+    return 0
+
+
+def print_results(results):
+    row = '{loader:<16} {files:>7} {depth:>5}  {stage:<30} {size:>8} {seconds:>10} {calls:>8} {peak:>10}'
+    print(row.format(loader='loader', files='files', depth='depth', stage='stage',
+                     size='result', seconds='seconds', calls='fs calls',
+                     peak='peak KiB'))
+    for result in results:
+        peak = '-' if result['peak'] is None else '{:.0f}'.format(result['peak'] / 1024)
+        print(row.format(seconds='{:.4f}'.format(result['seconds']), peak=peak,
+                         **dict((k, v) for k, v in result.items()
+                                if k not in ('seconds', 'peak'))))
+
+
+def compare_results(results, path, tolerance):
+    """
+    Returns `1` if any stage has become more than `tolerance` times slower
+    than it was in the results previously written to `path`
+    """
+    with io.open(path, encoding='utf-8') as f:
+        previous = dict(((x['loader'], x['files'], x['depth'], x['stage']), x)
+                        for x in json.load(f))
+    status = 0
+    for result in results:
+        before = previous.get((result['loader'], result['files'],
+                               result['depth'], result['stage']))
+        if before is None:
+            continue
+        # ignore noise in very quick stages.
+        slower = result['seconds'] - before['seconds'] > 0.005
+        if slower and result['seconds'] > before['seconds'] * tolerance:
+            print("SLOWER: {loader} {files} {depth} {stage}: {before:.4f}s -> {after:.4f}s".format(
+                before=before['seconds'], after=result['seconds'], **result))
+            status = 1
+    return status
+
+
+def integers(value):
+    return [int(x) for x in value.split(',') if x]
+
+
+def names(value):
+    chosen = [x for x in value.split(',') if x]
+    for name in chosen:
+        if name not in LOADERS:
+            raise argparse.ArgumentTypeError("Unknown loader {!r}".format(name))
+    return chosen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--sizes', type=integers, default=[1000, 10000, 100000],
+                        help="How many templates to generate (default: 1000,10000,100000)")
+    parser.add_argument('--depths', type=integers, default=[2, 5],
+                        help="How deeply to nest the directories (default: 2,5)")
+    parser.add_argument('--loaders', type=names, default=sorted(LOADERS),
+                        help="Which loaders to use (default: all of {})".format(
+                            ','.join(sorted(LOADERS))))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Report the best of this many runs (default: 3)")
+    parser.add_argument('--workdir', default=None,
+                        help="Where to generate (and keep) the trees; by default "
+                             "a temporary directory which is removed afterwards")
+    parser.add_argument('--json', default=None,
+                        help="Also write the results to this file")
+    parser.add_argument('--compare', default=None,
+                        help="Fail if anything is slower than in this file of "
+                             "earlier results")
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help="How many times slower counts as slower (default: 1.5)")
+    parser.add_argument('--child', nargs=4, default=None, help=argparse.SUPPRESS,
+                        metavar=('TREE', 'LOADER', 'FILES', 'DEPTH'))
+    options = parser.parse_args(argv)
+    if options.child:
+        tree, loader, count, depth = options.child
+        return run_child(tree, loader, int(count), int(depth), options.repeat)
+    return run_parent(options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+pytest_plugins = ['templateselector.testing']
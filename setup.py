@@ -6,7 +6,9 @@ from setuptools import setup, __version__ as setuptools_version
 from setuptools.command.test import test as TestCommand
 
 INSTALL_REQUIRES = []
-EXTRA_REQUIRES = {}
+EXTRA_REQUIRES = {
+    "watch": ["inotify_simple"],
+}
 scandir = "scandir>=1.5"
 if int(setuptools_version.split(".", 1)[0]) < 18:
     assert "bdist_wheel" not in sys.argv, "setuptools 18 required for wheels."
@@ -71,6 +73,8 @@ setup(
     long_description=LONG_DESCRIPTION,
     packages=[
         "templateselector",
+        "templateselector.management",
+        "templateselector.management.commands",
     ],
     include_package_data=True,
     install_requires=[
@@ -7,5 +7,7 @@ __version__ = '0.2.5'
 version = '0.2.5'
 VERSION = '0.2.5'
 
+default_app_config = 'templateselector.apps.TemplateSelectorConfig'
+
 def get_version():
     return version  # pragma: no cover
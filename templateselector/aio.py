@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Awaitable versions of the template listing, choices and existence checks,
+for use from within an event loop (eg: under ASGI) without blocking it on
+filesystem access.
+
+Everything which might touch the filesystem is run in an executor, and the
+results are shared with (and taken from) the same caches as the synchronous
+versions.
+
+Listings are fetched for each engine concurrently, rather than for each
+loader, as the inventory keeps (and shares) one listing per engine.
+
+Requires Python 3.5+
+"""
+from __future__ import unicode_literals, absolute_import
+import asyncio
+from django.template import TemplateDoesNotExist, engines
+from django.utils import six, translation
+from django.utils.module_loading import import_string
+from templateselector.fields import choices_cache, TemplateChoiceIterator
+from templateselector.inventory import inventory
+from templateselector.loading import load_template
+
+
+__all__ = ['aget_templates_from_loaders', 'aget_choices', 'aprepare_choices',
+           'atemplate_exists']
+
+
+def run_in_executor(executor, func, *args):
+    """
+    Call `func` in the `executor` (or the loop's default one), with the
+    currently active language also active in the thread it runs in.
+    """
+    loop = asyncio.get_event_loop()
+    language = translation.get_language()
+
+    def call():
+        with translation.override(language):
+            return func(*args)
+    return loop.run_in_executor(executor, call)
+
+
+def then(awaitable, callback):
+    """
+    A future for the result of calling `callback` with the result of
+    `awaitable`, once that's done. Chaining futures like this, rather than
+    using ``async def``, keeps the module parseable on Python 2.
+    """
+    source = asyncio.ensure_future(awaitable)
+    future = asyncio.get_event_loop().create_future()
+
+    def done(source):
+        if future.cancelled():
+            return
+        if source.cancelled():
+            future.cancel()
+        elif source.exception() is not None:
+            future.set_exception(source.exception())
+        else:
+            try:
+                future.set_result(callback(source.result()))
+            except Exception as e:
+                future.set_exception(e)
+
+    def cancelled(future):
+        if future.cancelled():
+            source.cancel()
+    source.add_done_callback(done)
+    future.add_done_callback(cancelled)
+    return future
+
+
+def resolved(value):
+    future = asyncio.get_event_loop().create_future()
+    future.set_result(value)
+    return future
+
+
+def aget_listings(prefix='', executor=None):
+    searchable = [engine for engine in engines.all() if hasattr(engine, 'engine')]
+    return asyncio.gather(*(
+        run_in_executor(executor, inventory.get_listing, engine, prefix)
+        for engine in searchable
+    ))
+
+
+def aget_templates_from_loaders(prefix='', executor=None):
+    """
+    A list of every template found, searching each engine concurrently.
+    """
+    def flatten(listings):
+        return [name for listing in listings for name in listing.with_prefix(prefix)]
+    return then(aget_listings(prefix=prefix, executor=executor), flatten)
+
+
+def aget_choices(match, display_name='templateselector.fields.nice_display_name',
+                 executor=None):
+    """
+    The sorted choices a `TemplateChoiceField` with the same `match` and
+    `display_name` would have.
+    """
+    if isinstance(display_name, six.string_types) and '.' in display_name:
+        display_name = import_string(display_name)
+    return run_in_executor(executor, choices_cache.get_choices, match,
+                           display_name)
+
+
+def aprepare_choices(field, executor=None):
+    """
+    Evaluate a `TemplateChoiceField`'s choices without blocking, so that
+    rendering or validating it afterwards doesn't touch the filesystem.
+    """
+    choices = field.choices
+    if isinstance(choices, TemplateChoiceIterator) and not choices.evaluated:
+        return then(run_in_executor(executor, tuple, choices), lambda _: field)
+    return resolved(field)
+
+
+def template_exists(name):
+    try:
+        load_template(name)
+    except TemplateDoesNotExist:
+        return False
+    return True
+
+
+def atemplate_exists(name, executor=None):
+    """
+    Whether the template exists, asking the inventory first and only loading
+    the template if the inventory can't be sure.
+    """
+    exists = inventory.exists(name)
+    if exists is not None:
+        return resolved(exists)
+    return run_in_executor(executor, template_exists, name)
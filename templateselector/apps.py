@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+import logging
+from django.apps import AppConfig
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateSelectorConfig(AppConfig):
+    name = 'templateselector'
+    verbose_name = 'Template selector'
+
+    def ready(self):
+        from templateselector import metrics
+        if getattr(settings, 'TEMPLATESELECTOR_METRICS', False):
+            metrics.enable()
+        if getattr(settings, 'TEMPLATESELECTOR_WARMUP_ON_READY', False):
+            from templateselector.warmup import warm_up
+            compile = getattr(settings, 'TEMPLATESELECTOR_WARMUP_COMPILE', False)
+            results = warm_up(compile=compile)
+            for result in results:
+                for name, error in result['errors']:
+                    logger.warning("Couldn't compile %r: %s", name, error)
+            logger.info("Warmed up %d template patterns in %.3fs", len(results),
+                        sum(x['choices_seconds'] + x['compile_seconds']
+                            for x in results))
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, absolute_import
+from collections import OrderedDict
 from operator import itemgetter
+from threading import Event, RLock
+from timeit import default_timer
+from weakref import WeakSet
 from django.conf import settings
 from django.contrib import admin
 from django.contrib.staticfiles import finders
@@ -9,41 +13,257 @@ from django.utils.deconstruct import deconstructible
 from django.utils.module_loading import import_string
 from django.utils.text import capfirst
 from django.core.checks import Warning
-from templateselector.handlers import get_results_from_registry
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from templateselector.handlers import get_match_prefix
+from templateselector.inventory import inventory
+from templateselector.loading import load_template, InstanceTemplateCache
+from templateselector.shared import get_shared_choices
+from templateselector.signals import (cache_lookup, choices_built,
+                                      template_validated, has_listeners)
 from templateselector.widgets import TemplateSelector, AdminTemplateSelector
 import re
 from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.core.validators import MaxLengthValidator
 from django.db.models import CharField
 from django.forms import TypedChoiceField
-from django.template import TemplateDoesNotExist, engines
+from django.forms.fields import CallableChoiceIterator
+from django.template import TemplateDoesNotExist
 from django.template.loader import get_template
 from django.utils.encoding import force_text
 from django.utils.functional import curry
-from django.utils.translation import ugettext_lazy as _
+from django.utils.lru_cache import lru_cache
+from django.utils.translation import get_language, ugettext, ugettext_lazy as _
 
 
 __all__ = ['TemplateField', 'TemplateChoiceField']
 
 
-def get_templates_from_loaders():
-    for engine in engines.all():
-        # I only know how to search the DjangoTemplates yo...
-        engine = getattr(engine, 'engine')
-        loaders = engine.template_loaders
-        for result in get_results_from_registry(loaders):
-            yield result
+def get_templates_from_loaders(prefix=''):
+    for result in inventory.get_templates(prefix=prefix):
+        yield result
 
 
-def nice_display_name(template_path):
-    setting = getattr(settings, 'TEMPLATESELECTOR_DISPLAY_NAMES', {})
-    if template_path in setting.keys():
-        return setting[template_path]
-    to_space_re = re.compile(r'[^a-zA-Z0-9\-]+')
+to_space_re = re.compile(r'[^a-zA-Z0-9\-]+')
+display_names_snapshot = {}
+
+
+def get_display_names():
+    """
+    The TEMPLATESELECTOR_DISPLAY_NAMES setting, looked up once and kept until
+    the setting changes.
+    """
+    try:
+        return display_names_snapshot['setting']
+    except KeyError:
+        setting = getattr(settings, 'TEMPLATESELECTOR_DISPLAY_NAMES', {})
+        display_names_snapshot['setting'] = setting
+        return setting
+
+
+@lru_cache(maxsize=1024)
+def get_nice_display_name(template_path, language):
     name = template_path.rpartition('/')[-1]
     basename = name.rpartition('.')[0]
     lastpart_spaces = to_space_re.sub(' ', basename)
-    return capfirst(_(lastpart_spaces))
+    return capfirst(ugettext(lastpart_spaces))
+
+
+def nice_display_name(template_path):
+    setting = get_display_names()
+    if template_path in setting:
+        return setting[template_path]
+    return get_nice_display_name(template_path, get_language())
+
+
+@receiver(setting_changed)
+def clear_display_names(setting, **kwargs):
+    if setting == 'TEMPLATESELECTOR_DISPLAY_NAMES':
+        display_names_snapshot.clear()
+    elif setting in ('LANGUAGES', 'LANGUAGE_CODE', 'LOCALE_PATHS'):
+        get_nice_display_name.cache_clear()
+
+
+def get_matching_templates(match_re, limit=None):
+    """
+    The distinct templates matching the regex, in no particular order, without
+    working out any display names; stops matching once `limit` are found.
+    The listing they're matched against is still built in full, if the
+    inventory doesn't already have it.
+    """
+    prefix = get_match_prefix(match_re.pattern)
+    found = []
+    seen = set()
+    if limit is not None and limit < 1:
+        return found
+    for choice in get_templates_from_loaders(prefix=prefix):
+        if choice not in seen and match_re.match(choice):
+            seen.add(choice)
+            found.append(choice)
+            if limit is not None and len(found) >= limit:
+                break
+    return found
+
+
+def get_choices(match_re, display_name):
+    listening = has_listeners(choices_built)
+    prefix = get_match_prefix(match_re.pattern)
+    names = get_templates_from_loaders(prefix=prefix)
+    if listening:
+        started = default_timer()
+        names = tuple(names)
+        listed = default_timer()
+    matched = set(name for name in names if match_re.match(name))
+    if listening:
+        filtered = default_timer()
+    results = [(name, display_name(name)) for name in matched]
+    if listening:
+        named = default_timer()
+    results.sort(key=itemgetter(1))
+    if listening:
+        choices_built.send(
+            sender=TemplateChoiceField, match=match_re.pattern,
+            display_name=display_name, scanned=len(names), matched=len(matched),
+            listing_duration=listed - started, filter_duration=filtered - listed,
+            display_name_duration=named - filtered,
+            sort_duration=default_timer() - named)
+    return tuple(results)
+
+
+class ChoicesCache(object):
+    """
+    A bounded, least-recently-used mapping of the sorted choices for a given
+    `match` regex and `display_name` callable, so that every field
+    (and every copy of it) using the same ones shares a single tuple.
+
+    The active language and the version of the template inventory are part of
+    the key, so those changing means the choices get built again.
+
+    Only one thread builds the choices for any given key, with any others
+    wanting them waiting for it to finish.
+    """
+    __slots__ = ('_lock', '_data', '_building', 'maxsize', 'hits', 'misses',
+                 'generation')
+
+    def __init__(self, maxsize=128):
+        self._lock = RLock()
+        self._data = OrderedDict()
+        self._building = {}
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+
+    def get_key(self, match_re, display_name):
+        return (match_re.pattern, match_re.flags, display_name, get_language(),
+                inventory.version)
+
+    def get_choices(self, match, display_name):
+        match_re = re.compile(match)
+        key = self.get_key(match_re, display_name)
+        with self._lock:
+            choices = self._data.pop(key, None)
+            if choices is not None:
+                # put it back, as the most recently used.
+                self._data[key] = choices
+                self.hits += 1
+            else:
+                building_key = (key, self.generation)
+                event = self._building.get(building_key)
+                is_builder = event is None
+                if is_builder:
+                    event = self._building[building_key] = Event()
+                    self.misses += 1
+        listening = has_listeners(cache_lookup)
+        if choices is not None:
+            if listening:
+                cache_lookup.send(sender=self.__class__, cache=self, key=key,
+                                  hit=True)
+            return choices
+        if not is_builder:
+            event.wait()
+            return self.get_choices(match, display_name)
+        if listening:
+            cache_lookup.send(sender=self.__class__, cache=self, key=key,
+                              hit=False)
+        try:
+            choices = get_shared_choices(match_re, display_name, get_choices)
+            with self._lock:
+                if building_key[1] == self.generation:
+                    self._data[key] = choices
+                    while len(self._data) > self.maxsize:
+                        self._data.popitem(last=False)
+        finally:
+            with self._lock:
+                self._building.pop(building_key, None)
+            event.set()
+        return choices
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+
+    def __len__(self):
+        return len(self._data)
+
+
+choices_cache = ChoicesCache(
+    maxsize=getattr(settings, 'TEMPLATESELECTOR_CHOICES_CACHE_SIZE', 128))
+
+
+# Every TemplateChoiceField still in use, so that `warmup` can find the
+# patterns used by forms.
+template_choice_fields = WeakSet()
+
+
+@receiver(setting_changed)
+def clear_choices_cache(setting, **kwargs):
+    if setting == 'TEMPLATES' or setting.startswith('TEMPLATESELECTOR_'):
+        choices_cache.clear()
+        choices_cache.maxsize = getattr(
+            settings, 'TEMPLATESELECTOR_CHOICES_CACHE_SIZE', 128)
+
+
+class TemplateChoiceIterator(CallableChoiceIterator):
+    """
+    Only evaluates the choices once, rather than every time they're iterated
+    over, as both the field and the widget do that repeatedly while
+    rendering & validating a form.
+
+    Copying the iterator (as happens to every field when a form is
+    instantiated) gives a fresh, unevaluated one, and the choices are
+    evaluated again if the inventory or choices cache have since been
+    cleared, or the language has changed.
+
+    `evaluations` counts how many times the choices were actually evaluated.
+    """
+    def __init__(self, choices_func):
+        super(TemplateChoiceIterator, self).__init__(choices_func)
+        self.evaluations = 0
+        self._generation = None
+        self._choices = None
+
+    def get_generation(self):
+        return (inventory.version, choices_cache.generation, get_language())
+
+    @property
+    def evaluated(self):
+        return (self._choices is not None and
+                self._generation == self.get_generation())
+
+    def __iter__(self):
+        generation = self.get_generation()
+        if self._choices is None or self._generation != generation:
+            self._choices = tuple(self.choices_func())
+            self._generation = generation
+            self.evaluations += 1
+        return iter(self._choices)
+
+    def __deepcopy__(self, memo):
+        result = self.__class__(self.choices_func)
+        memo[id(self)] = result
+        return result
 
 
 @deconstructible
@@ -57,9 +277,21 @@ class TemplateExistsValidator(object):
     def __call__(self, value):
         if not self.regex.match(value):
             raise ValidationError(self.wrong_pattern, params={'value': value})
-        try:
-            get_template(value)
-        except TemplateDoesNotExist:
+        exists = None
+        if getattr(settings, 'TEMPLATESELECTOR_VALIDATE_FROM_INVENTORY', False):
+            exists = inventory.exists(value)
+            source = 'inventory'
+        if exists is None:
+            source = 'loader'
+            try:
+                load_template(value)
+                exists = True
+            except TemplateDoesNotExist:
+                exists = False
+        if has_listeners(template_validated):
+            template_validated.send(sender=self.__class__, validator=self,
+                                    name=value, valid=exists, source=source)
+        if not exists:
             raise ValidationError(self.missing_template, params={'value': value})
 
 
@@ -151,9 +383,20 @@ class TemplateField(CharField):
         value = getattr(cls, field.attname)
         return self.display_name(value)
 
+    def get_template_cache(self, instance):
+        """
+        The `InstanceTemplateCache` kept on the model instance for this field.
+        """
+        attname = '_%s_template_cache' % self.name
+        try:
+            return instance.__dict__[attname]
+        except KeyError:
+            cache = instance.__dict__[attname] = InstanceTemplateCache()
+            return cache
+
     def __get_FIELD_template_instance(self, cls, field):
         value = getattr(cls, field.attname)
-        return get_template(value)
+        return field.get_template_cache(cls).get(value)
 
 
 class TemplateChoiceField(TypedChoiceField):
@@ -178,21 +421,35 @@ class TemplateChoiceField(TypedChoiceField):
             raise ImproperlyConfigured("Missing required $ at end")
 
         def lazysorted():
-            def filter_choices(regex_, namecaller_):
-                match_re = re.compile(regex_)
-                choices = get_templates_from_loaders()
-                for choice in choices:
-                    if match_re.match(choice):
-                        name = namecaller_(choice)
-                        yield (choice, name)
-            results = filter_choices(regex_=match, namecaller_=display_name)
-            return sorted(set(results), key=itemgetter(1))
+            return choices_cache.get_choices(match, display_name)
 
+        self.match = match
+        self.display_name = display_name
         self.choices = lazysorted
+        template_choice_fields.add(self)
         self.max_length = max_length
         if max_length is not None:
             self.validators.append(MaxLengthValidator(int(max_length)))
 
+    def __deepcopy__(self, memo):
+        result = super(TemplateChoiceField, self).__deepcopy__(memo)
+        # Have the widget use the field's copy of the choices, rather than
+        # its own, so that they're only evaluated once between them.
+        result.widget.choices = result._choices
+        return result
+
+    def _get_choices(self):
+        return self._choices
+
+    def _set_choices(self, value):
+        if callable(value):
+            value = TemplateChoiceIterator(value)
+            self._choices = self.widget.choices = value
+        else:
+            super(TemplateChoiceField, self)._set_choices(value)
+
+    choices = property(_get_choices, _set_choices)
+
     def prepare_value(self, value):
         """
         To avoid evaluating the lazysorted callable more than necessary to
@@ -204,11 +461,23 @@ class TemplateChoiceField(TypedChoiceField):
         - there's no prior initial set (either by being bound or by being set
           higher up the stack
         then forcibly select the only "good" value as the default.
+
+        Unless the choices have already been evaluated, finding out whether
+        there's only one is done by looking through the inventory for a second
+        matching template, without working out display names or sorting
+        anything.
         """
         if value is None and self.required:
-            choices =list(self.choices)
-            if len(choices) == 1:
-                value = choices[0][0]
+            choices = self.choices
+            if (isinstance(choices, TemplateChoiceIterator) and
+                    not choices.evaluated):
+                matches = get_matching_templates(re.compile(self.match), limit=2)
+                if len(matches) == 1:
+                    value = matches[0]
+            else:
+                choices = list(choices)
+                if len(choices) == 1:
+                    value = choices[0][0]
         return super(TemplateChoiceField, self).prepare_value(value)
 
 
@@ -1,6 +1,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, absolute_import
+import os
+import re
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+from timeit import default_timer
+from django.conf import settings
 from django.template.loaders import app_directories, filesystem, cached
+from templateselector.signals import templates_scanned, has_listeners
 try:
     from os import scandir
 except ImportError:  # pragma: no cover
@@ -17,32 +24,242 @@ except ImportError:  # pragma: no cover
         six.reraise(*sys.exc_info())
 
 
-__all__ = ['get_results_from_registry']
+__all__ = ['get_results_from_registry', 'get_loader_key', 'get_match_prefix',
+           'can_list_all']
 
 
-def scandir_recursive(path):
-    for item in scandir(path):
-        yield item
-        if item.is_dir(follow_symlinks=False):
-            for subitem in scandir_recursive(item.path):
-                yield subitem
+DEFAULT_EXCLUDE_DIRS = ('.git', '.hg', '.svn', '__pycache__', 'node_modules')
+
+
+def get_walk_options():
+    """
+    How the template directories should be walked, according to the settings.
+    """
+    exclude_dirs = getattr(settings, 'TEMPLATESELECTOR_EXCLUDE_DIRS',
+                           DEFAULT_EXCLUDE_DIRS)
+    extensions = getattr(settings, 'TEMPLATESELECTOR_EXTENSIONS', None)
+    if extensions is not None:
+        extensions = tuple(extensions)
+    return {
+        'exclude_dirs': frozenset(exclude_dirs or ()),
+        'extensions': extensions,
+        'follow_symlinks': getattr(settings, 'TEMPLATESELECTOR_FOLLOW_SYMLINKS', False),
+    }
+
+
+def would_be_walked(name, exclude_dirs=frozenset(), extensions=None,
+                    follow_symlinks=False):
+    """
+    Whether walking the template directories with the given options could
+    find the template `name`, or whether it'd be skipped because of its
+    extension or one of its directories.
+    """
+    if extensions is not None and not name.endswith(extensions):
+        return False
+    directories = name.split('/')[:-1]
+    return not any(directory in exclude_dirs for directory in directories)
+
+
+def get_directory_id(path):
+    stat = os.stat(path)
+    return (stat.st_dev, stat.st_ino)
+
+
+class VisitedDirectories(object):
+    """
+    The directories a walk following symlinks has visited (or is going to),
+    which can be shared by several threads walking different parts of a tree.
+    """
+    __slots__ = ('_ids', '_lock')
+
+    def __init__(self, paths=()):
+        self._ids = set()
+        self._lock = Lock()
+        for path in paths:
+            self.add(path)
+
+    def add(self, path):
+        """
+        Record the directory at `path`, returning `False` if it had already
+        been visited.
+        """
+        directory_id = get_directory_id(path)
+        with self._lock:
+            if directory_id in self._ids:
+                return False
+            self._ids.add(directory_id)
+            return True
+
+
+def scandir_recursive(path, exclude_dirs=frozenset(), follow_symlinks=False,
+                      visited=None):
+    """
+    Yields every entry below `path`, depth first, skipping (and not
+    descending into) any directory whose name is in `exclude_dirs`
+
+    Directories which are symlinks are only descended into if
+    `follow_symlinks` is set, in which case each directory is only visited
+    once, however many ways there are to reach it. Directories already in
+    `visited` (by default, just `path`) aren't visited again.
+    """
+    if follow_symlinks and visited is None:
+        visited = VisitedDirectories([path])
+    stack = [scandir(path)]
+    while stack:
+        for item in stack[-1]:
+            is_dir = item.is_dir(follow_symlinks=follow_symlinks)
+            if is_dir and item.name in exclude_dirs:
+                continue
+            yield item
+            if is_dir:
+                if follow_symlinks and not visited.add(item.path):
+                    continue
+                stack.append(scandir(item.path))
+                break
+        else:
+            stack.pop()
 
 usable_loaders = {}
 
-def from_filesystem(instance):
-    dirs = instance.get_dirs()
-    for directory in dirs:
+
+def get_start_directories(instance, prefix=''):
+    """
+    Yields each template directory, and where within it to start walking
+    for the `prefix`. Prefixes which walking the whole directory would skip
+    (because part of them is excluded, or a symlink which isn't followed)
+    aren't walked either.
+    """
+    parts = [part for part in prefix.split('/') if part]
+    options = get_walk_options()
+    if any(part in options['exclude_dirs'] for part in parts):
+        return
+    for directory in instance.get_dirs():
+        start = directory
+        if parts:
+            start = os.path.join(directory, *parts)
+            if not os.path.isdir(start):
+                continue
+            if not options['follow_symlinks'] and is_below_symlink(directory, parts):
+                continue
+        yield directory, start
+
+
+def is_below_symlink(directory, parts):
+    path = directory
+    for part in parts:
+        path = os.path.join(path, part)
+        if os.path.islink(path):
+            return True
+    return False
+
+
+def iter_files(path, strip_first, exclude_dirs=frozenset(), extensions=None,
+               follow_symlinks=False, visited=None):
+    walker = scandir_recursive(path, exclude_dirs=exclude_dirs,
+                               follow_symlinks=follow_symlinks, visited=visited)
+    for item in walker:
+        if extensions is not None and not item.name.endswith(extensions):
+            continue
+        if item.is_file():
+            yield item.path[strip_first+1:]
+
+
+def walk_files(path, strip_first, **options):
+    return list(iter_files(path, strip_first, **options))
+
+
+def walk_concurrently(starts, workers, threshold, exclude_dirs=frozenset(),
+                      extensions=None, follow_symlinks=False):
+    """
+    Look at the top level of every start directory, and then walk the
+    directories found there using a pool of `workers` threads, yielding the
+    results in the same order as walking them one after another would.
+
+    If fewer than `threshold` directories are found, they're walked without
+    bothering with the threads.
+
+    When following symlinks, every thread shares the same record of the
+    directories visited, so no directory is walked twice.
+    """
+    starts = list(starts)
+    visited = None
+    if follow_symlinks:
+        visited = VisitedDirectories(start for directory, start in starts)
+    options = {'exclude_dirs': exclude_dirs, 'extensions': extensions,
+               'follow_symlinks': follow_symlinks, 'visited': visited}
+    # Each part is either a file name, or the index of a directory to walk.
+    parts = []
+    tasks = []
+    for directory, start in starts:
         strip_first = len(directory)
-        for item in scandir_recursive(directory):
-            if item.is_file():
-                yield item.path[strip_first+1:]
+        for item in scandir(start):
+            if item.is_dir(follow_symlinks=follow_symlinks):
+                if item.name in exclude_dirs:
+                    continue
+                if not follow_symlinks or visited.add(item.path):
+                    parts.append(len(tasks))
+                    tasks.append((item.path, strip_first))
+            elif extensions is not None and not item.name.endswith(extensions):
+                continue
+            elif item.is_file():
+                parts.append(item.path[strip_first+1:])
+    if len(tasks) < threshold:
+        walked = [walk_files(path, strip_first, **options)
+                  for path, strip_first in tasks]
+    else:
+        pool = ThreadPool(processes=min(workers, len(tasks)))
+        try:
+            walked = pool.map(lambda task: walk_files(*task, **options), tasks)
+        finally:
+            pool.close()
+            pool.join()
+    for part in parts:
+        if isinstance(part, int):
+            for result in walked[part]:
+                yield result
+        else:
+            yield part
+
 
-def from_cached(instance):
+def send_scanned(instance, directory, prefix, results, started):
+    templates_scanned.send(sender=instance.__class__, loader=instance,
+                           directory=directory, prefix=prefix,
+                           files=len(results), duration=default_timer() - started)
+
+
+def from_filesystem(instance, prefix=''):
+    starts = get_start_directories(instance, prefix=prefix)
+    options = get_walk_options()
+    listening = has_listeners(templates_scanned)
+    workers = getattr(settings, 'TEMPLATESELECTOR_SCAN_WORKERS', 0)
+    if workers > 1:
+        threshold = getattr(settings, 'TEMPLATESELECTOR_SCAN_THRESHOLD', 8)
+        results = walk_concurrently(starts, workers, threshold, **options)
+        if listening:
+            started = default_timer()
+            results = list(results)
+            send_scanned(instance, None, prefix, results, started)
+        for result in results:
+            yield result
+        return
+    if options['follow_symlinks']:
+        starts = list(starts)
+        options['visited'] = VisitedDirectories(start for directory, start in starts)
+    for directory, start in starts:
+        results = iter_files(start, len(directory), **options)
+        if listening:
+            started = default_timer()
+            results = list(results)
+            send_scanned(instance, directory, prefix, results, started)
+        for result in results:
+            yield result
+
+def from_cached(instance, prefix=''):
     """
     Just go and look at the registry again using the child loaders...
     """
     loaders = instance.loaders
-    for result in get_results_from_registry(loaders):
+    for result in get_results_from_registry(loaders, prefix=prefix):
         yield result
 
 usable_loaders[app_directories.Loader] = from_filesystem
@@ -50,10 +267,103 @@ usable_loaders[filesystem.Loader] = from_filesystem
 usable_loaders[cached.Loader] = from_cached
 
 
-def get_results_from_registry(loaders):
+def get_results_from_registry(loaders, prefix=''):
+    """
+    Yields every template the loaders can find. If a `prefix` (a directory
+    path like ``myapp/layouts/``) is given, only that part of each template
+    directory is searched.
+    """
     for loader in loaders:
         cls = loader.__class__
         if cls in usable_loaders:
             finder = usable_loaders[cls]
-            for result in finder(instance=loader):
+            for result in finder(instance=loader, prefix=prefix):
                 yield result
+
+
+def can_list_all(loaders):
+    """
+    Whether every template the loaders could load would also be found by
+    `get_results_from_registry`
+    """
+    for loader in loaders:
+        if loader.__class__ not in usable_loaders:
+            return False
+        if hasattr(loader, 'loaders') and not can_list_all(loader.loaders):
+            return False
+    return True
+
+
+def get_template_directories(loaders):
+    """
+    Every directory `from_filesystem` would search for the loaders, including
+    any wrapped by a cached loader.
+    """
+    for loader in loaders:
+        if usable_loaders.get(loader.__class__) is from_filesystem:
+            for directory in loader.get_dirs():
+                yield directory
+        elif hasattr(loader, 'loaders'):
+            for directory in get_template_directories(loader.loaders):
+                yield directory
+
+
+def get_loader_key(loaders):
+    """
+    Something hashable which changes whenever the loaders, or the directories
+    they would search, change.
+    """
+    keys = []
+    for loader in loaders:
+        cls = loader.__class__
+        if hasattr(loader, 'loaders'):
+            children = get_loader_key(loader.loaders)
+        elif hasattr(loader, 'get_dirs'):
+            children = tuple(loader.get_dirs())
+        else:
+            children = ()
+        keys.append((cls.__module__, cls.__name__, children))
+    return tuple(keys)
+
+
+regex_special_chars = frozenset('.^$*+?{}[]|()\\')
+regex_quantifiers = frozenset('*+?{')
+regex_inline_flags_re = re.compile(r'\(\?[aiLmsux]+[):]')
+
+
+def get_match_prefix(regex):
+    """
+    Pull the fixed leading directory path out of a `match` regex, so that only
+    that part of each template directory needs searching. eg: given
+    ``^myapp/layouts/.+\\.html$`` it returns ``myapp/layouts/``
+
+    Returns an empty string if there's no usable prefix.
+    """
+    if not regex.startswith('^') or '|' in regex:
+        return ''
+    if regex_inline_flags_re.search(regex):
+        return ''
+    chars = []
+    index = 1
+    length = len(regex)
+    while index < length:
+        char = regex[index]
+        if char == '\\':
+            escaped = regex[index+1:index+2]
+            if not escaped or escaped.isalnum():
+                break
+            chars.append(escaped)
+            index += 2
+        elif char in regex_quantifiers:
+            # the last character was optional or repeated, so can't be part
+            # of the prefix.
+            if chars:
+                chars.pop()
+            break
+        elif char in regex_special_chars:
+            break
+        else:
+            chars.append(char)
+            index += 1
+    prefix = ''.join(chars)
+    return prefix[:prefix.rfind('/') + 1]
@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+import logging
+import posixpath
+from bisect import bisect_left
+from threading import Event, RLock, Thread
+from timeit import default_timer
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template import engines
+from templateselector.handlers import (get_results_from_registry, get_loader_key,
+                                       can_list_all, get_walk_options,
+                                       would_be_walked)
+from templateselector.manifest import read_manifest, get_manifest_key
+from templateselector.shared import get_shared_listing, set_shared_listing
+from templateselector.signals import cache_lookup, has_listeners
+
+
+__all__ = ['TemplateListing', 'TemplateInventory', 'ScanDeadlineExceeded',
+           'inventory']
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateListing(tuple):
+    """
+    A sorted, de-duplicated tuple of template names, which means it can answer
+    prefix & membership questions without looking at every name.
+    """
+    __slots__ = ()
+
+    def __new__(cls, names=()):
+        return super(TemplateListing, cls).__new__(cls, sorted(set(names)))
+
+    def __contains__(self, name):
+        index = bisect_left(self, name)
+        return index < len(self) and self[index] == name
+
+    def with_prefix(self, prefix):
+        if not prefix:
+            for name in self:
+                yield name
+            return
+        index = bisect_left(self, prefix)
+        length = len(self)
+        while index < length:
+            name = self[index]
+            if not name.startswith(prefix):
+                break
+            yield name
+            index += 1
+
+    def with_changes(self, added=(), removed=()):
+        names = set(self)
+        names.update(added)
+        names.difference_update(removed)
+        return self.__class__(names)
+
+
+class ScanDeadlineExceeded(Exception):
+    pass
+
+
+def until_deadline(results, deadline):
+    """
+    Pass through the `results`, giving up if they're still coming once the
+    `deadline` (according to `default_timer`) has passed.
+    """
+    for result in results:
+        if default_timer() > deadline:
+            raise ScanDeadlineExceeded("Searching the template directories "
+                                       "took too long")
+        yield result
+
+
+def get_refresh_options():
+    """
+    How long a listing may be used before it's refreshed in the background,
+    and how long that refresh may take, in seconds; `None` for either means
+    never.
+    """
+    return (getattr(settings, 'TEMPLATESELECTOR_REFRESH_AFTER', None),
+            getattr(settings, 'TEMPLATESELECTOR_REFRESH_DEADLINE', None))
+
+
+def get_parent_prefixes(prefix):
+    """
+    Every directory `prefix` lives within, longest first, down to the empty
+    string; so ``a/b/`` gives ``a/b/``, ``a/`` and finally ``''``
+    """
+    while prefix:
+        yield prefix
+        prefix = prefix[:prefix.rstrip('/').rfind('/') + 1]
+    yield ''
+
+
+class TemplateInventory(object):
+    """
+    A listing of every template the known loaders can find, built once per
+    engine & loader configuration and then kept for the life of the process,
+    or until `clear` is called.
+
+    Listings may be built for only part of the template directories (see
+    `get_match_prefix`) and any listing for a parent directory will be used
+    to answer questions about the directories within it.
+
+    If the TEMPLATESELECTOR_MANIFEST setting points at a manifest file, the
+    listings are read from that instead of searching the directories.
+
+    Only one thread builds any given listing; while it does so, any other
+    thread wanting the same listing is given the one from before the last
+    `clear`, if there was one, or waits for the build to finish.
+
+    If the TEMPLATESELECTOR_REFRESH_AFTER setting is a number of seconds,
+    listings older than that (and those from before the last `clear`) are
+    still returned immediately, but are rebuilt by a background thread.
+
+    `version` changes whenever the listings may have changed.
+    """
+    __slots__ = ('_lock', '_listings', '_previous', '_building', '_built',
+                 '_refreshing', '_manifest', '_generation', 'version')
+
+    def __init__(self):
+        self._lock = RLock()
+        self._listings = {}
+        self._previous = {}
+        self._building = {}
+        self._built = {}
+        self._refreshing = {}
+        self._manifest = None
+        self._generation = 0
+        self.version = 0
+
+    def get_manifest(self):
+        if self._manifest is None:
+            path = getattr(settings, 'TEMPLATESELECTOR_MANIFEST', None)
+            manifest = read_manifest(path) if path else {}
+            keys = set(get_manifest_key(*self.get_key(engine))
+                       for engine in engines.all() if hasattr(engine, 'engine'))
+            if manifest and keys and not keys.intersection(manifest):
+                logger.warning(
+                    "None of the engines in the TEMPLATESELECTOR_MANIFEST file "
+                    "%r match the current template settings (have the template "
+                    "directories moved since it was written?), so the "
+                    "directories will be searched instead", path)
+            self._manifest = manifest
+        return self._manifest
+
+    def get_manifest_listing(self, key):
+        names = self.get_manifest().get(get_manifest_key(*key))
+        if names is None or hasattr(names, 'with_prefix'):
+            return names
+        return TemplateListing(names)
+
+    def get_key(self, engine):
+        # I only know how to search the DjangoTemplates yo...
+        loaders = getattr(engine, 'engine').template_loaders
+        return (engine.name, get_loader_key(loaders))
+
+    def find_cached_listing(self, key, prefix='', previous=False):
+        """
+        Find the listing which covers the `prefix`, if there is one, returning
+        the prefix it was built for and the listing itself.
+        """
+        listings = self._previous if previous else self._listings
+        for parent in get_parent_prefixes(prefix):
+            listing = listings.get((key, parent))
+            if listing is not None:
+                return parent, listing
+        return None, None
+
+    def get_cached_listing(self, key, prefix='', previous=False):
+        return self.find_cached_listing(key, prefix, previous=previous)[1]
+
+    def build_listing(self, engine, key, prefix='', deadline=None,
+                      refresh=False):
+        listing = self.get_manifest_listing(key)
+        if listing is not None:
+            return '', listing
+        loaders = engine.engine.template_loaders
+
+        def walk():
+            results = get_results_from_registry(loaders, prefix=prefix)
+            if deadline is not None:
+                results = until_deadline(results, deadline)
+            return TemplateListing(results)
+        listing = get_shared_listing(engine, prefix, walk, refresh=refresh)
+        if not isinstance(listing, TemplateListing):
+            listing = TemplateListing(listing)
+        return prefix, listing
+
+    def store_listing(self, key, prefix, listing, generation):
+        """
+        Keep a newly built listing, unless `clear` was called while it was
+        being built. Returns whether it was kept.
+        """
+        with self._lock:
+            if self._generation != generation:
+                return False
+            self._listings[(key, prefix)] = listing
+            self._built[(key, prefix)] = default_timer()
+            self._previous.pop((key, prefix), None)
+            return True
+
+    def refresh_listing(self, engine, key, prefix, generation, deadline=None,
+                        token=None):
+        """
+        Build the listing again, replacing the one currently in use if it's
+        changed. If that fails, or takes longer than `deadline` seconds, the
+        current one is kept for another TEMPLATESELECTOR_REFRESH_AFTER seconds.
+
+        If the refresh was started with a `token` and has since been given up
+        on (see `abandon_refresh`), whatever it found is thrown away.
+        """
+        if deadline is not None:
+            deadline += default_timer()
+        try:
+            built_prefix, listing = self.build_listing(engine, key, prefix,
+                                                       deadline=deadline,
+                                                       refresh=True)
+        except ScanDeadlineExceeded:
+            logger.warning("Refreshing the templates for %r took longer than "
+                           "%s seconds, keeping the previous ones",
+                           engine.name, get_refresh_options()[1])
+            built_prefix, listing = prefix, None
+        except Exception:
+            logger.exception("Couldn't refresh the templates for %r, "
+                             "keeping the previous ones", engine.name)
+            built_prefix, listing = prefix, None
+        with self._lock:
+            if token is not None:
+                if self._refreshing.get((key, prefix)) is not token:
+                    return None
+            self._refreshing.pop((key, prefix), None)
+            current = self.get_cached_listing(key, built_prefix)
+            if current is None:
+                current = self.get_cached_listing(key, built_prefix, previous=True)
+            if listing is None:
+                listing = current
+            if listing is None:
+                return None
+            if self.store_listing(key, built_prefix, listing, generation):
+                if listing is not current and listing != current:
+                    self.version += 1
+        return listing
+
+    def abandon_refresh(self, thread, engine, key, prefix, token, deadline):
+        """
+        Wait up to `deadline` seconds for the refresh `thread`, and if it's
+        still going (eg: stuck in a `scandir` call, which the deadline checks
+        between results can't interrupt), stop waiting for it, so another
+        refresh can be started.
+        """
+        thread.join(deadline)
+        if not thread.is_alive():
+            return False
+        with self._lock:
+            if self._refreshing.get((key, prefix)) is not token:
+                return False
+            del self._refreshing[(key, prefix)]
+        logger.warning("Refreshing the templates for %r is still going after "
+                       "%s seconds, giving up on it", engine.name, deadline)
+        return True
+
+    def start_refresh(self, engine, key, prefix):
+        with self._lock:
+            if (key, prefix) in self._refreshing:
+                return None
+            token = self._refreshing[(key, prefix)] = object()
+            generation = self._generation
+        deadline = get_refresh_options()[1]
+        thread = Thread(target=self.refresh_listing,
+                        args=(engine, key, prefix, generation, deadline, token),
+                        name='templateselector-refresh')
+        thread.daemon = True
+        thread.start()
+        if deadline is not None:
+            watchdog = Thread(target=self.abandon_refresh,
+                              args=(thread, engine, key, prefix, token, deadline),
+                              name='templateselector-refresh-deadline')
+            watchdog.daemon = True
+            watchdog.start()
+        return thread
+
+    def find_or_build_listing(self, engine, prefix=''):
+        """
+        Returns the listing covering `prefix`, and whether it had to be built.
+        """
+        key = self.get_key(engine)
+        refresh_after = get_refresh_options()[0]
+        if refresh_after is None:
+            listing = self.get_cached_listing(key, prefix)
+            if listing is not None:
+                return listing, False
+        else:
+            parent, listing = self.find_cached_listing(key, prefix)
+            if listing is None:
+                parent, listing = self.find_cached_listing(key, prefix,
+                                                           previous=True)
+                if listing is not None:
+                    self.start_refresh(engine, key, parent)
+                    return listing, False
+            else:
+                built = self._built.get((key, parent), 0)
+                if default_timer() - built > refresh_after:
+                    self.start_refresh(engine, key, parent)
+                return listing, False
+        with self._lock:
+            listing = self.get_cached_listing(key, prefix)
+            if listing is not None:
+                return listing, False
+            generation = self._generation
+            building_key = (key, prefix, generation)
+            event = self._building.get(building_key)
+            is_builder = event is None
+            if is_builder:
+                event = self._building[building_key] = Event()
+        if not is_builder:
+            listing = self.get_cached_listing(key, prefix, previous=True)
+            if listing is not None:
+                return listing, False
+            event.wait()
+            # If the build failed, or the inventory was cleared meanwhile,
+            # this will go and build it instead.
+            return self.find_or_build_listing(engine, prefix=prefix)
+        try:
+            built_prefix, listing = self.build_listing(engine, key, prefix)
+            self.store_listing(key, built_prefix, listing, generation)
+        finally:
+            with self._lock:
+                self._building.pop(building_key, None)
+            event.set()
+        return listing, True
+
+    def get_listing(self, engine, prefix=''):
+        listing, built = self.find_or_build_listing(engine, prefix=prefix)
+        if has_listeners(cache_lookup):
+            cache_lookup.send(sender=self.__class__, cache=self,
+                              key=(self.get_key(engine), prefix), hit=not built)
+        return listing
+
+    def apply_changes(self, key, added=(), removed=()):
+        """
+        Add and remove template names from every listing already built for
+        the engine & loader configuration `key`, rather than searching the
+        template directories again. Returns whether anything changed.
+        """
+        changed = []
+        with self._lock:
+            for (listing_key, prefix), listing in tuple(self._listings.items()):
+                if listing_key != key:
+                    continue
+                adding = [name for name in added
+                          if name.startswith(prefix) and name not in listing]
+                removing = [name for name in removed
+                            if name.startswith(prefix) and name in listing]
+                if adding or removing:
+                    if not isinstance(listing, TemplateListing):
+                        listing = TemplateListing(listing)
+                    listing = listing.with_changes(adding, removing)
+                    self._listings[(listing_key, prefix)] = listing
+                    changed.append((prefix, listing))
+            if changed:
+                self.version += 1
+                if self._building or self._refreshing:
+                    # Anything being built right now may not include the
+                    # changes, so mustn't be kept.
+                    self._generation += 1
+        if changed and self.get_manifest_listing(key) is None:
+            engine = engines[key[0]]
+            for prefix, listing in changed:
+                set_shared_listing(engine, prefix, listing)
+        return bool(changed)
+
+    def get_templates(self, prefix=''):
+        for engine in engines.all():
+            listing = self.get_listing(engine, prefix=prefix)
+            for result in listing.with_prefix(prefix):
+                yield result
+
+    def exists(self, name):
+        """
+        Answer whether a template exists using only the listings already
+        built, returning `True` or `False` if possible, or `None` if the
+        listings can't say for certain (because they haven't been built yet,
+        because an engine has loaders which can't be listed, or because the
+        TEMPLATESELECTOR_EXTENSIONS or TEMPLATESELECTOR_EXCLUDE_DIRS settings
+        would have skipped it).
+        """
+        if posixpath.isabs(name) or posixpath.normpath(name) != name:
+            return None
+        if not would_be_walked(name, **get_walk_options()):
+            return None
+        prefix = name[:name.rfind('/') + 1]
+        answer = False
+        for engine in engines.all():
+            if not hasattr(engine, 'engine'):
+                answer = None
+                continue
+            listing = self.get_cached_listing(self.get_key(engine), prefix)
+            if listing is not None and name in listing:
+                return True
+            if listing is None or not can_list_all(engine.engine.template_loaders):
+                answer = None
+        return answer
+
+    def clear(self):
+        with self._lock:
+            self._previous = self._listings
+            self._listings = {}
+            self._built = {}
+            self._manifest = None
+            self._generation += 1
+            self.version += 1
+
+    def __len__(self):
+        return len(self._listings)
+
+
+inventory = TemplateInventory()
+
+
+@receiver(setting_changed)
+def clear_inventory(setting, **kwargs):
+    if setting in ('TEMPLATES', 'TEMPLATESELECTOR_MANIFEST',
+                   'TEMPLATESELECTOR_EXCLUDE_DIRS', 'TEMPLATESELECTOR_EXTENSIONS',
+                   'TEMPLATESELECTOR_FOLLOW_SYMLINKS'):
+        inventory.clear()
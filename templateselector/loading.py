@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+from collections import OrderedDict
+from threading import RLock
+from timeit import default_timer
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from templateselector.inventory import inventory
+from templateselector.signals import cache_lookup, has_listeners
+
+
+__all__ = ['MissingTemplateCache', 'missing_templates', 'CompiledTemplateCache',
+           'compiled_templates', 'InstanceTemplateCache', 'load_template']
+
+
+class MissingTemplateCache(object):
+    """
+    A bounded record of template names which couldn't be loaded, so that
+    asking for them again doesn't mean trying every loader & directory again.
+
+    Entries are forgotten after `timeout` seconds (or never, if it's `None`)
+    and whenever the template inventory changes. A `timeout` of ``0`` turns
+    the whole thing off.
+    """
+    __slots__ = ('_lock', '_data', 'maxsize', 'timeout', 'hits')
+
+    def __init__(self, maxsize=1024, timeout=0):
+        self._lock = RLock()
+        self._data = OrderedDict()
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.hits = 0
+
+    @property
+    def enabled(self):
+        return self.timeout != 0 and self.maxsize > 0
+
+    def __contains__(self, name):
+        entry = self._data.get(name)
+        if entry is None:
+            return False
+        added, version = entry
+        expired = (self.timeout is not None and
+                   default_timer() - added > self.timeout)
+        if expired or version != inventory.version:
+            with self._lock:
+                self._data.pop(name, None)
+            return False
+        self.hits += 1
+        return True
+
+    def add(self, name):
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._data.pop(name, None)
+            self._data[name] = (default_timer(), inventory.version)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+missing_templates = MissingTemplateCache(
+    maxsize=getattr(settings, 'TEMPLATESELECTOR_MISSING_TEMPLATES_SIZE', 1024),
+    timeout=getattr(settings, 'TEMPLATESELECTOR_MISSING_TEMPLATES_TIMEOUT', 0))
+
+
+@receiver(setting_changed)
+def clear_missing_templates(setting, **kwargs):
+    if setting == 'TEMPLATES' or setting.startswith('TEMPLATESELECTOR_MISSING_'):
+        missing_templates.clear()
+        missing_templates.maxsize = getattr(
+            settings, 'TEMPLATESELECTOR_MISSING_TEMPLATES_SIZE', 1024)
+        missing_templates.timeout = getattr(
+            settings, 'TEMPLATESELECTOR_MISSING_TEMPLATES_TIMEOUT', 0)
+
+
+class CompiledTemplateCache(object):
+    """
+    A bounded, least-recently-used mapping of template names to the compiled
+    templates, for projects which don't use the cached template loader.
+    Entries are forgotten whenever the template inventory changes.
+    """
+    __slots__ = ('_lock', '_data', 'maxsize', 'enabled', 'hits')
+
+    def __init__(self, maxsize=256, enabled=False):
+        self._lock = RLock()
+        self._data = OrderedDict()
+        self.maxsize = maxsize
+        self.enabled = enabled
+        self.hits = 0
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.pop(name, None)
+            if entry is None:
+                return None
+            template, version = entry
+            if version != inventory.version:
+                return None
+            self._data[name] = entry
+            self.hits += 1
+            return template
+
+    def add(self, name, template):
+        with self._lock:
+            self._data[name] = (template, inventory.version)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+compiled_templates = CompiledTemplateCache(
+    maxsize=getattr(settings, 'TEMPLATESELECTOR_COMPILED_TEMPLATES_SIZE', 256),
+    enabled=getattr(settings, 'TEMPLATESELECTOR_CACHE_COMPILED_TEMPLATES', False))
+
+
+@receiver(setting_changed)
+def clear_compiled_templates(setting, **kwargs):
+    if setting in ('TEMPLATES', 'TEMPLATESELECTOR_COMPILED_TEMPLATES_SIZE',
+                   'TEMPLATESELECTOR_CACHE_COMPILED_TEMPLATES'):
+        compiled_templates.clear()
+        compiled_templates.maxsize = getattr(
+            settings, 'TEMPLATESELECTOR_COMPILED_TEMPLATES_SIZE', 256)
+        compiled_templates.enabled = getattr(
+            settings, 'TEMPLATESELECTOR_CACHE_COMPILED_TEMPLATES', False)
+
+
+def load_template(name):
+    """
+    `get_template`, except that names recently found not to exist fail
+    immediately, without asking the loaders again, and (if enabled) compiled
+    templates are re-used.
+    """
+    listening = has_listeners(cache_lookup)
+    missing = name in missing_templates
+    if listening and missing_templates.enabled:
+        cache_lookup.send(sender=MissingTemplateCache, cache=missing_templates,
+                          key=name, hit=missing)
+    if missing:
+        raise TemplateDoesNotExist(name)
+    if compiled_templates.enabled:
+        template = compiled_templates.get(name)
+        if listening:
+            cache_lookup.send(sender=CompiledTemplateCache,
+                              cache=compiled_templates, key=name,
+                              hit=template is not None)
+        if template is not None:
+            return template
+    try:
+        template = get_template(name)
+    except TemplateDoesNotExist:
+        missing_templates.add(name)
+        raise
+    if compiled_templates.enabled:
+        compiled_templates.add(name, template)
+    return template
+
+
+class InstanceTemplateCache(object):
+    """
+    Holds the compiled template for a model instance's `TemplateField`,
+    along with the value it was loaded for, so that assigning a new value
+    means loading again.
+
+    Pickling (or deep copying) the instance gives an empty one, as compiled
+    templates don't need to go along for the ride.
+    """
+    __slots__ = ('name', 'template')
+
+    def __init__(self):
+        self.name = None
+        self.template = None
+
+    def get(self, name):
+        if self.template is None or self.name != name:
+            self.template = load_template(name)
+            self.name = name
+        return self.template
+
+    def set(self, name, template):
+        self.name = name
+        self.template = template
+
+    def __reduce__(self):
+        return (self.__class__, ())
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from templateselector.manifest import write_manifest
+
+
+class Command(BaseCommand):
+    help = ("Writes a manifest of every template the loaders can find, for "
+            "use as the TEMPLATESELECTOR_MANIFEST")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-o', '--output', dest='output', default=None,
+            help="Where to write the manifest; defaults to the TEMPLATESELECTOR_MANIFEST setting")
+        parser.add_argument(
+            '--format', dest='format', default='json', choices=('json', 'mmap'),
+            help="Write JSON, or a file which can be memory-mapped and shared by every process")
+
+    def handle(self, *args, **options):
+        path = options['output'] or getattr(settings, 'TEMPLATESELECTOR_MANIFEST', None)
+        if not path:
+            raise CommandError("Provide --output, or configure TEMPLATESELECTOR_MANIFEST")
+        manifest = write_manifest(path, format=options['format'])
+        count = sum(len(x['templates']) for x in manifest['engines'])
+        self.stdout.write("Wrote {count} templates for {engines} engine(s) to {path}".format(
+            count=count, engines=len(manifest['engines']), path=path))
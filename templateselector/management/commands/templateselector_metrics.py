@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+from django.core.management import BaseCommand
+from templateselector import metrics
+from templateselector.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = ("Warms up every TemplateField & TemplateChoiceField pattern (see "
+            "templateselector_warmup) and prints the metrics collected while "
+            "doing so, in the Prometheus text format. These only cover this "
+            "command's own warm-up, not any running server; scrape "
+            "templateselector.views.metrics for those")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--compile', dest='compile', action='store_true', default=False,
+            help="Also load (and so compile) every matching template")
+
+    def handle(self, *args, **options):
+        was_enabled = metrics.is_enabled()
+        metrics.enable()
+        try:
+            warm_up(compile=options['compile'])
+        finally:
+            if not was_enabled:
+                metrics.disable()
+        self.stdout.write(metrics.metrics.render(), ending='')
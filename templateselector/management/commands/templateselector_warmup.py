@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+from django.core.management import BaseCommand
+from templateselector.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = ("Builds the choices for every TemplateField & TemplateChoiceField "
+            "pattern, optionally compiling the matching templates, and reports "
+            "how long it took")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--compile', dest='compile', action='store_true', default=False,
+            help="Also load (and so compile) every matching template")
+        parser.add_argument(
+            '--language', dest='languages', action='append', default=[],
+            help="Build the choices for this language; may be given more than "
+                 "once, and defaults to the LANGUAGE_CODE setting")
+
+    def handle(self, *args, **options):
+        results = warm_up(compile=options['compile'],
+                          languages=options['languages'])
+        total = 0
+        for result in results:
+            total += result['choices_seconds'] + result['compile_seconds']
+            self.stdout.write("{match}: {choices} choices in {seconds:.3f}s".format(
+                match=result['match'], choices=result['choices'],
+                seconds=result['choices_seconds']))
+            if options['compile']:
+                self.stdout.write("{match}: compiled {compiled} templates in {seconds:.3f}s".format(
+                    match=result['match'], compiled=result['compiled'],
+                    seconds=result['compile_seconds']))
+            for name, error in result['errors']:
+                self.stderr.write("{match}: couldn't compile {name}: {error!s}".format(
+                    match=result['match'], name=name, error=error))
+        self.stdout.write("Warmed up {count} pattern(s) in {seconds:.3f}s".format(
+            count=len(results), seconds=total))
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+from django.db.models import Manager, Model, QuerySet
+from django.template import TemplateDoesNotExist
+from templateselector.fields import TemplateField
+from templateselector.loading import load_template
+
+
+__all__ = ['prefetch_templates', 'TemplateQuerySet', 'TemplateManager']
+
+
+def prefetch_templates(instances, *field_names):
+    """
+    Load the template for each distinct value of the given `TemplateField`
+    names just once, and hand it to every one of the model `instances`
+    using that value, so that their `get_<fieldname>_instance` doesn't need
+    to load it again.
+
+    Values which don't point at a template are left alone, so that
+    `get_<fieldname>_instance` will still raise `TemplateDoesNotExist`
+    """
+    instances = [obj for obj in instances if isinstance(obj, Model)]
+    if not instances or not field_names:
+        return None
+    opts = instances[0]._meta
+    for field_name in field_names:
+        field = opts.get_field(field_name)
+        if not isinstance(field, TemplateField):
+            raise ValueError("'%s' is not a TemplateField on %s" % (
+                field_name, opts.label))
+        templates = {}
+        for obj in instances:
+            value = getattr(obj, field.attname)
+            if not value:
+                continue
+            if value not in templates:
+                try:
+                    templates[value] = load_template(value)
+                except TemplateDoesNotExist:
+                    templates[value] = None
+            template = templates[value]
+            if template is not None:
+                field.get_template_cache(obj).set(value, template)
+
+
+class TemplateQuerySet(QuerySet):
+    def __init__(self, *args, **kwargs):
+        super(TemplateQuerySet, self).__init__(*args, **kwargs)
+        self._prefetch_template_fields = ()
+        self._prefetch_templates_done = False
+
+    def prefetch_templates(self, *field_names):
+        """
+        Like `prefetch_related`, but for the templates selected by
+        `TemplateField` values: each distinct template is loaded once, however
+        many rows use it.
+
+        Passing `None` clears the list of fields to prefetch.
+        """
+        clone = self._clone()
+        if field_names == (None,):
+            clone._prefetch_template_fields = ()
+        else:
+            clone._prefetch_template_fields = (
+                clone._prefetch_template_fields + field_names)
+        return clone
+
+    def _clone(self, **kwargs):
+        clone = super(TemplateQuerySet, self)._clone(**kwargs)
+        clone._prefetch_template_fields = self._prefetch_template_fields
+        return clone
+
+    def _fetch_all(self):
+        super(TemplateQuerySet, self)._fetch_all()
+        if self._prefetch_template_fields and not self._prefetch_templates_done:
+            prefetch_templates(self._result_cache, *self._prefetch_template_fields)
+            self._prefetch_templates_done = True
+
+
+TemplateManager = Manager.from_queryset(TemplateQuerySet, str('TemplateManager'))
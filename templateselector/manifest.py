@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+import io
+import json
+import mmap
+import os
+import tempfile
+from django.core.exceptions import ImproperlyConfigured
+from django.template import engines
+from templateselector.handlers import get_results_from_registry, get_loader_key
+
+
+__all__ = ['build_manifest', 'write_manifest', 'read_manifest',
+           'get_manifest_key', 'MappedListing']
+
+MANIFEST_VERSION = 1
+MAPPED_MAGIC = b'TEMPLATESELECTOR\x00MANIFEST\x01\n'
+NEWLINE = b'\n'
+
+# os.replace is Python 3.3+, but renaming over a file is atomic on POSIX.
+replace = getattr(os, 'replace', os.rename)
+
+
+def get_manifest_key(engine_name, loaders_key):
+    """
+    The string used to identify an engine & loader configuration within a
+    manifest, which needs to survive a round trip through JSON.
+    """
+    return json.dumps([engine_name, loaders_key], separators=(',', ':'))
+
+
+def build_manifest():
+    """
+    Walk every engine's loaders (ignoring any cached inventory) and return
+    the templates found for each, ready to be written out.
+    """
+    entries = []
+    for engine in engines.all():
+        if not hasattr(engine, 'engine'):
+            continue
+        loaders = engine.engine.template_loaders
+        templates = sorted(set(get_results_from_registry(loaders)))
+        entries.append({
+            'engine': engine.name,
+            'loaders': get_loader_key(loaders),
+            'templates': templates,
+        })
+    return {'version': MANIFEST_VERSION, 'engines': entries}
+
+
+def write_manifest(path, format='json'):
+    """
+    Write out a manifest for the current settings, either as `json` or in a
+    format which can be memory-mapped (`mmap`) and so shared between all the
+    processes which read it.
+    """
+    manifest = build_manifest()
+    if format == 'mmap':
+        write_mapped_manifest(path, manifest)
+    else:
+        data = json.dumps(manifest, separators=(',', ':'), ensure_ascii=False)
+        write_atomically(path, [data.encode('utf-8')])
+    return manifest
+
+
+def write_atomically(path, chunks):
+    """
+    Write the `chunks` of bytes to a temporary file alongside `path`, and
+    then move it over `path`, so processes still reading (or mapping) the
+    old manifest never see a partly written one.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.manifest-')
+    try:
+        with io.open(fd, mode='wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        try:
+            mode = os.stat(path).st_mode
+        except OSError:
+            mode = 0o644
+        os.chmod(temp_path, mode & 0o777)
+        replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_mapped_manifest(path, manifest):
+    """
+    The file starts with `MAPPED_MAGIC`, followed by a single line of JSON
+    describing where each engine's templates live (as byte offsets into the
+    remainder of the file), followed by every engine's templates, sorted and
+    one per line.
+    """
+    sections = []
+    chunks = []
+    offset = 0
+    for entry in manifest['engines']:
+        encoded = sorted(x.encode('utf-8') for x in entry['templates'])
+        chunk = b''.join(x + NEWLINE for x in encoded)
+        sections.append({
+            'key': get_manifest_key(entry['engine'], entry['loaders']),
+            'start': offset,
+            'end': offset + len(chunk),
+            'count': len(encoded),
+        })
+        chunks.append(chunk)
+        offset += len(chunk)
+    header = {'version': manifest['version'], 'sections': sections}
+    header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    write_atomically(path, [MAPPED_MAGIC, header + NEWLINE] + chunks)
+
+
+class MappedListing(object):
+    """
+    The sorted templates for one engine, read directly out of a memory-mapped
+    manifest file, so that the pages holding them are shared between every
+    process using the same file, and names only become strings when asked for.
+
+    Has the same interface as `inventory.TemplateListing`
+    """
+    __slots__ = ('_map', '_start', '_end', '_count')
+
+    def __init__(self, mapped, start, end, count):
+        self._map = mapped
+        self._start = start
+        self._end = end
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def _iter_from(self, position):
+        mapped = self._map
+        end = self._end
+        while position < end:
+            line_end = mapped.find(NEWLINE, position, end)
+            if line_end == -1:
+                line_end = end
+            yield mapped[position:line_end]
+            position = line_end + 1
+
+    def __iter__(self):
+        for line in self._iter_from(self._start):
+            yield line.decode('utf-8')
+
+    def _bisect_left(self, target):
+        """
+        The offset of the first line which is not less than `target`
+        """
+        mapped = self._map
+        low = self._start
+        high = self._end
+        while low < high:
+            middle = (low + high) // 2
+            newline = mapped.rfind(NEWLINE, low, middle)
+            line_start = low if newline == -1 else newline + 1
+            line_end = mapped.find(NEWLINE, line_start, self._end)
+            if line_end == -1:
+                line_end = self._end
+            if mapped[line_start:line_end] < target:
+                low = line_end + 1
+            else:
+                high = line_start
+        return low
+
+    def __contains__(self, name):
+        target = name.encode('utf-8')
+        position = self._bisect_left(target)
+        for line in self._iter_from(position):
+            return line == target
+        return False
+
+    def with_prefix(self, prefix):
+        target = prefix.encode('utf-8')
+        position = self._bisect_left(target) if target else self._start
+        for line in self._iter_from(position):
+            if not line.startswith(target):
+                break
+            yield line.decode('utf-8')
+
+
+def read_mapped_manifest(path):
+    with io.open(path, mode='rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header_end = mapped.find(NEWLINE, len(MAPPED_MAGIC))
+    if header_end == -1:
+        raise ValueError("the header is incomplete")
+    header = json.loads(mapped[len(MAPPED_MAGIC):header_end].decode('utf-8'))
+    if header.get('version') != MANIFEST_VERSION:
+        return header, {}
+    data_start = header_end + 1
+    data_length = len(mapped) - data_start
+    results = {}
+    for section in header['sections']:
+        start, end = section['start'], section['end']
+        if not 0 <= start <= end <= data_length:
+            raise ValueError("the templates are incomplete")
+        if start < end and mapped[data_start + end - 1:data_start + end] != NEWLINE:
+            raise ValueError("the templates are incomplete")
+        results[section['key']] = MappedListing(
+            mapped, start=data_start + section['start'],
+            end=data_start + section['end'], count=section['count'])
+    return header, results
+
+
+def read_manifest(path):
+    """
+    Returns a dictionary of `get_manifest_key` strings to the template names
+    found for that engine & loader configuration; for a memory-mapped manifest
+    they're `MappedListing` instances rather than lists.
+    """
+    try:
+        with io.open(path, mode='rb') as f:
+            mapped = f.read(len(MAPPED_MAGIC)) == MAPPED_MAGIC
+        if mapped:
+            manifest, results = read_mapped_manifest(path)
+        else:
+            with io.open(path, mode='r', encoding='utf-8') as f:
+                manifest = json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        msg = ("Could not read the TEMPLATESELECTOR_MANIFEST file {path!r}: {e!s}\n"
+               "Create it using `manage.py templateselector_manifest`")
+        raise ImproperlyConfigured(msg.format(path=path, e=e))
+    if manifest.get('version') != MANIFEST_VERSION:
+        msg = ("The TEMPLATESELECTOR_MANIFEST file {path!r} is an unknown "
+               "version, create it again using `manage.py templateselector_manifest`")
+        raise ImproperlyConfigured(msg.format(path=path))
+    if mapped:
+        return results
+    results = {}
+    for entry in manifest['engines']:
+        key = get_manifest_key(entry['engine'], entry['loaders'])
+        results[key] = entry['templates']
+    return results
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Counters & histograms of what the template inventory and caches are doing,
+collected from `templateselector.signals` when the TEMPLATESELECTOR_METRICS
+setting is on, and rendered in the Prometheus text exposition format (see
+`views.metrics` and ``manage.py templateselector_metrics``).
+
+The numbers are per process.
+"""
+from __future__ import unicode_literals, absolute_import
+from bisect import bisect_left
+from threading import Lock
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from templateselector.signals import (cache_lookup, choices_built,
+                                      template_validated, templates_scanned,
+                                      widget_rendered)
+
+
+__all__ = ['Counter', 'Histogram', 'Metrics', 'metrics', 'enable', 'disable',
+           'is_enabled', 'CONTENT_TYPE']
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+CACHE_NAMES = {
+    'TemplateInventory': 'inventory',
+    'ChoicesCache': 'choices',
+    'MissingTemplateCache': 'missing_templates',
+    'CompiledTemplateCache': 'compiled_templates',
+}
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels:
+        value = ('{}'.format(value).replace('\\', '\\\\').replace('\n', '\\n')
+                 .replace('"', '\\"'))
+        pairs.append('{}="{}"'.format(name, value))
+    return '{' + ','.join(pairs) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[x] for x in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(tuple(labels[x] for x in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(object):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._lock = Lock()
+        self.clear()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            yield ('{}_bucket'.format(self.name),
+                   (('le', format_value(bound)),), cumulative)
+        yield '{}_sum'.format(self.name), (), total
+        yield '{}_count'.format(self.name), (), count
+
+    def clear(self):
+        with self._lock:
+            self._counts = [0] * len(self.buckets)
+            self.sum = 0.0
+            self.count = 0
+
+
+class Metrics(object):
+    """
+    Every metric collected, and the signal receivers which update them.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.cache_lookups = Counter(
+            'templateselector_cache_lookups_total',
+            "Lookups in the inventory, choices, missing templates and compiled "
+            "templates caches", ('cache', 'result'))
+        self.inventory_builds = Counter(
+            'templateselector_inventory_builds_total',
+            "Template listings which had to be built")
+        self.scanned_files = Counter(
+            'templateselector_scanned_files_total',
+            "Files found by walking the template directories")
+        self.scan_duration = Histogram(
+            'templateselector_scan_duration_seconds',
+            "Time taken to walk each template directory")
+        self.choices_duration = Histogram(
+            'templateselector_choices_build_duration_seconds',
+            "Time taken to build the choices for a match")
+        self.render_duration = Histogram(
+            'templateselector_widget_render_duration_seconds',
+            "Time taken to render a TemplateSelector widget")
+        self.validations = Counter(
+            'templateselector_validations_total',
+            "Templates checked by TemplateExistsValidator",
+            ('source', 'result'))
+
+    def __iter__(self):
+        return iter((self.cache_lookups, self.inventory_builds,
+                     self.scanned_files, self.scan_duration,
+                     self.choices_duration, self.render_duration,
+                     self.validations))
+
+    def clear(self):
+        for metric in self:
+            metric.clear()
+
+    def render(self):
+        lines = []
+        for metric in self:
+            lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            for name, labels, value in metric.samples():
+                lines.append('{}{} {}'.format(name, format_labels(labels),
+                                              format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def on_cache_lookup(self, sender, hit, **kwargs):
+        cache = CACHE_NAMES.get(sender.__name__, sender.__name__)
+        self.cache_lookups.inc(cache=cache, result='hit' if hit else 'miss')
+        if cache == 'inventory' and not hit:
+            self.inventory_builds.inc()
+
+    def on_templates_scanned(self, sender, files, duration, **kwargs):
+        self.scanned_files.inc(files)
+        self.scan_duration.observe(duration)
+
+    def on_choices_built(self, sender, listing_duration, filter_duration,
+                         display_name_duration, sort_duration, **kwargs):
+        self.choices_duration.observe(listing_duration + filter_duration +
+                                      display_name_duration + sort_duration)
+
+    def on_widget_rendered(self, sender, context_duration, render_duration,
+                           **kwargs):
+        self.render_duration.observe(context_duration + render_duration)
+
+    def on_template_validated(self, sender, valid, source, **kwargs):
+        self.validations.inc(source=source, result='valid' if valid else 'invalid')
+
+    def get_receivers(self):
+        return ((cache_lookup, self.on_cache_lookup),
+                (templates_scanned, self.on_templates_scanned),
+                (choices_built, self.on_choices_built),
+                (widget_rendered, self.on_widget_rendered),
+                (template_validated, self.on_template_validated))
+
+
+metrics = Metrics()
+
+
+def enable():
+    for signal, func in metrics.get_receivers():
+        signal.connect(func, weak=False, dispatch_uid=func.__name__)
+    metrics.enabled = True
+
+
+def disable():
+    for signal, func in metrics.get_receivers():
+        signal.disconnect(dispatch_uid=func.__name__)
+    metrics.enabled = False
+
+
+def is_enabled():
+    return metrics.enabled
+
+
+@receiver(setting_changed)
+def toggle_metrics(setting, **kwargs):
+    if setting == 'TEMPLATESELECTOR_METRICS':
+        if getattr(settings, 'TEMPLATESELECTOR_METRICS', False):
+            enable()
+        else:
+            disable()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Where the time goes when listing templates and building choices: how many
+files are in each template directory and how long walking it takes, and for
+each `TemplateField` & `TemplateChoiceField` pattern, how much of what was
+walked its regex throws away and how long the display names & sorting take.
+
+The directories are walked directly rather than through the inventory, and
+the choices are built without the choices cache or remembered display names;
+they do use the inventory, so a pattern's listing time only includes walking
+the directories if nothing had listed them yet.
+"""
+from __future__ import unicode_literals, absolute_import
+import re
+from django.template import engines
+from templateselector.fields import get_choices, get_nice_display_name
+from templateselector.handlers import get_match_prefix, get_results_from_registry
+from templateselector.signals import choices_built, templates_scanned
+from templateselector.warmup import get_patterns
+
+
+__all__ = ['profile_directories', 'profile_patterns']
+
+
+def get_loader_name(loader):
+    cls = loader.__class__
+    return '{}.{}'.format(cls.__module__, cls.__name__)
+
+
+def profile_directories():
+    """
+    Walk every template directory of every loader of every Django template
+    engine, returning a dictionary per directory with the number of `files`
+    found, the `seconds` taken and the `path_bytes` of the template names.
+
+    When TEMPLATESELECTOR_SCAN_WORKERS walks a loader's directories together,
+    there's one result for all of them, with a `directory` of `None`.
+    """
+    results = []
+
+    def scanned(sender, loader, directory, files, duration, **kwargs):
+        results.append({'engine': alias, 'loader': get_loader_name(loader),
+                        'directory': directory, 'files': files,
+                        'seconds': duration, 'path_bytes': 0})
+
+    templates_scanned.connect(scanned)
+    try:
+        for engine in engines.all():
+            alias = engine.name
+            loaders = getattr(getattr(engine, 'engine', None), 'template_loaders', ())
+            for loader in loaders:
+                # the signal for each directory is sent before any of the
+                # templates found in it are yielded.
+                for name in get_results_from_registry([loader]):
+                    results[-1]['path_bytes'] += len(name.encode('utf-8'))
+    finally:
+        templates_scanned.disconnect(scanned)
+    return results
+
+
+def profile_patterns(patterns=None):
+    """
+    Build the choices for every pattern (see `warmup.get_patterns`) without
+    using the caches, returning a dictionary per pattern with the number of
+    templates `scanned` below its `prefix`, how many `matched`, the share of
+    the scanned templates it `discarded` (counting any found in more than
+    one directory each time), and the seconds spent
+    listing, filtering, working out display names and sorting.
+    """
+    if patterns is None:
+        patterns = get_patterns()
+    results = []
+
+    def built(sender, **kwargs):
+        results.append(kwargs)
+
+    choices_built.connect(built)
+    try:
+        for match, display_name in patterns:
+            get_nice_display_name.cache_clear()
+            get_choices(re.compile(match), display_name)
+            result = results[-1]
+            result['prefix'] = get_match_prefix(match)
+            result['discarded'] = 0.0
+            if result['scanned']:
+                result['discarded'] = 1 - result['matched'] / float(result['scanned'])
+    finally:
+        choices_built.disconnect(built)
+    return results
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Sharing the template listings and choices between processes (or hosts) using
+one of Django's cache backends, so only one of them has to search the
+template directories.
+
+Listings are keyed by a fingerprint of the engine, its loaders, the walk
+settings, and the names & modification times of everything directly within
+each template directory (or the part of it being searched), so processes
+with different templates, or templates which have since changed, don't
+share them. Changes further down aren't noticed by the fingerprint, so
+refreshing a listing (or applying the changes a watcher saw) writes it back.
+
+Choices are keyed by the template names they were built from, so they follow
+whatever listing the process is using, and by the display names setting and
+translations their labels came from.
+"""
+from __future__ import unicode_literals, absolute_import
+import hashlib
+import json
+import os
+import sys
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.encoding import force_text
+from django.utils.lru_cache import lru_cache
+from django.utils.translation import get_language
+from templateselector.handlers import (scandir, get_loader_key, get_match_prefix,
+                                       get_walk_options, get_template_directories)
+
+
+__all__ = ['get_shared_cache', 'get_listing_key', 'get_choices_key',
+           'get_shared_listing', 'set_shared_listing', 'get_shared_choices']
+
+SHARED_VERSION = 2
+
+
+def get_shared_cache():
+    """
+    The cache named by the TEMPLATESELECTOR_CACHE setting, if there is one.
+    """
+    alias = getattr(settings, 'TEMPLATESELECTOR_CACHE', None)
+    if alias is None:
+        return None
+    return caches[alias]
+
+
+def get_timeout():
+    return getattr(settings, 'TEMPLATESELECTOR_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def get_directory_state(path):
+    """
+    The names & modification times of everything directly within `path`
+    """
+    try:
+        entries = sorted((item.name, item.stat(follow_symlinks=False).st_mtime)
+                         for item in scandir(path))
+    except OSError:
+        return None
+    return [os.stat(path).st_mtime, entries]
+
+
+def get_fingerprint(engine, prefix=''):
+    loaders = engine.engine.template_loaders
+    options = get_walk_options()
+    state = []
+    for directory in get_template_directories(loaders):
+        start = directory
+        if prefix:
+            start = os.path.join(directory, *prefix.split('/'))
+        state.append([directory, get_directory_state(start)])
+    data = json.dumps([
+        SHARED_VERSION, engine.name, get_loader_key(loaders), prefix,
+        sorted(options['exclude_dirs']), options['extensions'],
+        options['follow_symlinks'], state,
+    ], separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def get_listing_key(engine, prefix=''):
+    return 'templateselector:listing:{}'.format(get_fingerprint(engine, prefix))
+
+
+def get_display_name_path(display_name):
+    """
+    The dotted path to `display_name` if it can be imported from there (and
+    so will be the same in every process), otherwise `None`
+    """
+    module = getattr(display_name, '__module__', None)
+    name = getattr(display_name, '__name__', None)
+    if module is None or name is None:
+        return None
+    if getattr(sys.modules.get(module), name, None) is not display_name:
+        return None
+    return '{}.{}'.format(module, name)
+
+
+@lru_cache(maxsize=None)
+def get_catalog_digest(language):
+    """
+    A digest of the translations for `language`, so labels translated by a
+    different catalog aren't shared.
+    """
+    if language is None or not settings.USE_I18N:
+        return None
+    from django.utils.translation import trans_real
+    catalog = getattr(trans_real.translation(language), '_catalog', None) or {}
+    digest = hashlib.sha1()
+    for item in sorted(repr(item) for item in catalog.items()):
+        digest.update(item.encode('utf-8') + b'\n')
+    return digest.hexdigest()
+
+
+def get_display_names_digest():
+    setting = getattr(settings, 'TEMPLATESELECTOR_DISPLAY_NAMES', {})
+    data = json.dumps(sorted((force_text(name), force_text(label))
+                             for name, label in setting.items()),
+                      separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+@receiver(setting_changed)
+def clear_catalog_digests(setting, **kwargs):
+    if setting in ('USE_I18N', 'LANGUAGES', 'LANGUAGE_CODE', 'LOCALE_PATHS',
+                   'INSTALLED_APPS'):
+        get_catalog_digest.cache_clear()
+
+
+def get_choices_key(match_re, display_name_path):
+    # imported here, as the inventory uses this module.
+    from templateselector.inventory import inventory
+    prefix = get_match_prefix(match_re.pattern)
+    language = get_language()
+    data = json.dumps([SHARED_VERSION, match_re.pattern, match_re.flags,
+                       display_name_path, language,
+                       get_display_names_digest(), get_catalog_digest(language)],
+                      separators=(',', ':'))
+    digest = hashlib.sha1(data.encode('utf-8'))
+    for name in inventory.get_templates(prefix=prefix):
+        digest.update(b'\n' + name.encode('utf-8'))
+    return 'templateselector:choices:{}'.format(digest.hexdigest())
+
+
+def get_shared_listing(engine, prefix, build, refresh=False):
+    """
+    Fetch the sorted template names for the `engine` & `prefix` from the
+    shared cache, or `build` them and put them there. If `refresh` is set,
+    they're always built, replacing whatever was there.
+    """
+    cache = get_shared_cache()
+    if cache is None:
+        return build()
+    key = get_listing_key(engine, prefix)
+    names = None if refresh else cache.get(key)
+    if names is None:
+        names = build()
+        cache.set(key, list(names), get_timeout())
+    return names
+
+
+def set_shared_listing(engine, prefix, names):
+    """
+    Replace the template names for the `engine` & `prefix` in the shared
+    cache, if there is one.
+    """
+    cache = get_shared_cache()
+    if cache is not None:
+        cache.set(get_listing_key(engine, prefix), list(names), get_timeout())
+
+
+def get_shared_choices(match_re, display_name, build):
+    """
+    Fetch the choices for the `match_re` and `display_name` from the shared
+    cache, or `build` them and put them there. Choices for a `display_name`
+    which can't be imported by its dotted path aren't shared.
+    """
+    cache = get_shared_cache()
+    path = get_display_name_path(display_name)
+    if cache is None or path is None:
+        return build(match_re, display_name)
+    key = get_choices_key(match_re, path)
+    choices = cache.get(key)
+    if choices is None:
+        choices = tuple((name, force_text(label))
+                        for name, label in build(match_re, display_name))
+        cache.set(key, choices, get_timeout())
+    return choices
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Signals sent while finding templates, building choices and rendering the
+widget, saying how long each part took, so that they can be fed into logging
+or metrics.
+
+Nothing is timed or sent unless something is connected to the signal.
+"""
+from __future__ import unicode_literals, absolute_import
+from django.dispatch import Signal
+
+
+__all__ = ['templates_scanned', 'choices_built', 'widget_rendered',
+           'cache_lookup', 'template_validated', 'has_listeners']
+
+
+# Sent by `handlers.from_filesystem` after walking each template directory
+# (or, when walking with threads, all of a loader's directories at once, in
+# which case `directory` is `None`), with the sender being the loader's class.
+templates_scanned = Signal(providing_args=[
+    'loader', 'directory', 'prefix', 'files', 'duration'])
+
+# Sent by `fields.get_choices` after building the choices for a `match`, with
+# how many templates were looked at (`scanned`) and how many matched, and how
+# long it took to get the listing, filter it with the regex, work out the
+# display names, and sort them.
+choices_built = Signal(providing_args=[
+    'match', 'display_name', 'scanned', 'matched', 'listing_duration',
+    'filter_duration', 'display_name_duration', 'sort_duration'])
+
+# Sent by `widgets.TemplateSelector.render`, with how long it took to work
+# out the options (which includes evaluating the choices, if they hadn't been
+# already) and how long it took to render them.
+widget_rendered = Signal(providing_args=[
+    'widget', 'name', 'options', 'context_duration', 'render_duration'])
+
+# Sent whenever the template inventory, choices cache, missing templates
+# cache or compiled templates cache is asked for something, with the sender
+# being the class of the cache and `hit` saying whether it had it.
+cache_lookup = Signal(providing_args=['cache', 'key', 'hit'])
+
+# Sent by `fields.TemplateExistsValidator` after checking a template which
+# matches its regex exists, saying whether it did, and whether the `source`
+# of the answer was the ``inventory`` or the template ``loader``.
+template_validated = Signal(providing_args=['validator', 'name', 'valid',
+                                            'source'])
+
+
+def has_listeners(signal):
+    """
+    Whether anything at all is connected to the `signal`. Unlike
+    `Signal.has_listeners` this doesn't take a lock or look at the senders, so
+    it's cheap enough to ask before doing any timing.
+    """
+    return bool(signal.receivers)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for tests which want to make sure that the template directories are
+searched, and templates compiled, no more often than expected, in the spirit
+of Django's `assertNumQueries`::
+
+    from templateselector.testing import assertNumTemplateScans
+
+    def test_rendering_the_form_scans_once():
+        inventory.clear()
+        with assertNumTemplateScans(1):
+            MyForm().as_p()
+
+A scan is one search of a filesystem or app directories loader's template
+directories; a compile is one call to `get_template` made when validating a
+`TemplateField` value or by ``instance.get_<field>_instance()``.
+
+The `template_scans` and `template_compiles` pytest fixtures give counters
+which run for the whole test; use them by adding
+``pytest_plugins = ['templateselector.testing']`` to your ``conftest.py``.
+"""
+from __future__ import unicode_literals, absolute_import
+from contextlib import contextmanager
+from threading import Lock
+from templateselector import handlers, loading
+try:
+    import pytest
+except ImportError:  # pragma: no cover
+    pytest = None
+
+
+__all__ = ['TemplateScanCounter', 'TemplateCompileCounter',
+           'assertNumTemplateScans', 'assertNumTemplateCompiles']
+
+
+class Counter(object):
+    """
+    Replaces module attributes with wrappers which count calls to them,
+    between `start` and `stop`, or while used as a context manager.
+    """
+    targets = ()
+
+    def __init__(self):
+        self._lock = Lock()
+        self._originals = []
+        self.reset()
+
+    def reset(self):
+        pass
+
+    def start(self):
+        for module, name in self.targets:
+            original = getattr(module, name)
+            self._originals.append((module, name, original))
+            setattr(module, name, self.wrap(name, original))
+        return self
+
+    def stop(self):
+        while self._originals:
+            module, name, original = self._originals.pop()
+            setattr(module, name, original)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class TemplateScanCounter(Counter):
+    """
+    Counts the `scans` of the loaders' template directories, and how many
+    `directories` were opened while doing them.
+    """
+    targets = ((handlers, 'get_start_directories'), (handlers, 'scandir'))
+
+    def reset(self):
+        self.scans = 0
+        self.directories = 0
+        self.prefixes = []
+
+    def wrap(self, name, original):
+        if name == 'scandir':
+            def counting(path, *args, **kwargs):
+                with self._lock:
+                    self.directories += 1
+                return original(path, *args, **kwargs)
+        else:
+            def counting(instance, prefix=''):
+                with self._lock:
+                    self.scans += 1
+                    self.prefixes.append(prefix)
+                return original(instance, prefix=prefix)
+        return counting
+
+
+class TemplateCompileCounter(Counter):
+    """
+    Records the `names` of the templates `load_template` asked the template
+    engines for (whether or not they existed).
+    """
+    targets = ((loading, 'get_template'),)
+
+    def reset(self):
+        self.names = []
+
+    @property
+    def compiles(self):
+        return len(self.names)
+
+    def wrap(self, name, original):
+        def counting(template_name, *args, **kwargs):
+            with self._lock:
+                self.names.append(template_name)
+            return original(template_name, *args, **kwargs)
+        return counting
+
+
+@contextmanager
+def assertNumTemplateScans(num):
+    """
+    Fails unless the template directories are scanned exactly `num` times
+    within the block.
+    """
+    with TemplateScanCounter() as counter:
+        yield counter
+    if counter.scans != num:
+        raise AssertionError(
+            "{scans} template scans were made, {num} expected (prefixes: "
+            "{prefixes!r}, {directories} directories opened)".format(
+                num=num, **counter.__dict__))
+
+
+@contextmanager
+def assertNumTemplateCompiles(num):
+    """
+    Fails unless exactly `num` templates are loaded within the block.
+    """
+    with TemplateCompileCounter() as counter:
+        yield counter
+    if counter.compiles != num:
+        raise AssertionError(
+            "{compiles} templates were loaded, {num} expected: {names!r}".format(
+                compiles=counter.compiles, num=num, names=counter.names))
+
+
+if pytest is not None:
+    @pytest.yield_fixture
+    def template_scans():
+        with TemplateScanCounter() as counter:
+            yield counter
+
+    @pytest.yield_fixture
+    def template_compiles():
+        with TemplateCompileCounter() as counter:
+            yield counter
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import time
+
+import pytest
+
+from templateselector import fields, inventory as inventory_module
+from templateselector.inventory import inventory
+
+
+@pytest.yield_fixture
+def record_calls(monkeypatch):
+    """
+    ``record_calls(module, name, record)`` replaces the function with one
+    which appends ``record(*args, **kwargs)`` to the list returned, and
+    optionally sleeps for `delay` seconds, before calling the original.
+    """
+    def patch(module, name, record, delay=0):
+        calls = []
+        original = getattr(module, name)
+        def recording(*args, **kwargs):
+            calls.append(record(*args, **kwargs))
+            if delay:
+                time.sleep(delay)
+            return original(*args, **kwargs)
+        monkeypatch.setattr(module, name, recording)
+        return calls
+    yield patch
+
+
+def get_prefix(loaders, prefix=''):
+    return prefix
+
+
+def get_pattern(match_re, display_name):
+    return match_re.pattern
+
+
+@pytest.yield_fixture
+def scans(record_calls):
+    """
+    The prefix searched each time the inventory searches the template
+    directories, starting from an empty inventory.
+    """
+    inventory.clear()
+    yield record_calls(inventory_module, 'get_results_from_registry', get_prefix)
+    inventory.clear()
+
+
+@pytest.yield_fixture
+def slow_scans(record_calls):
+    inventory.clear()
+    yield record_calls(inventory_module, 'get_results_from_registry', get_prefix,
+                       delay=0.05)
+    inventory.clear()
+
+
+@pytest.yield_fixture
+def builds(record_calls):
+    """
+    The `match` each time choices are built, starting from an empty choices
+    cache.
+    """
+    fields.choices_cache.clear()
+    yield record_calls(fields, 'get_choices', get_pattern)
+    fields.choices_cache.clear()
+
+
+@pytest.yield_fixture
+def slow_builds(record_calls):
+    fields.choices_cache.clear()
+    yield record_calls(fields, 'get_choices', get_pattern, delay=0.05)
+    fields.choices_cache.clear()
+
+
+@pytest.yield_fixture
+def get_template_calls(template_compiles):
+    yield template_compiles.names
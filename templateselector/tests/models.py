@@ -4,10 +4,13 @@ from django.db.models import Model
 from django.utils.encoding import force_text
 from django.utils.six import python_2_unicode_compatible
 from templateselector.fields import TemplateField
+from templateselector.managers import TemplateManager
 
 @python_2_unicode_compatible
 class MyModel(Model):
-    f = TemplateField(match="^admin/.+\.html$", verbose_name="test 'f'")
+    f = TemplateField(match=r"^admin/.+\.html$", verbose_name="test 'f'")
+
+    objects = TemplateManager()
 
     def __str__(self):
         return force_text(self.pk)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import sys
+
+import pytest
+
+if sys.version_info < (3, 5):
+    pytest.skip("asyncio support requires Python 3.5+", allow_module_level=True)
+
+import asyncio
+import threading
+
+from django.utils import translation
+
+from templateselector import inventory as inventory_module
+from templateselector.aio import (aget_templates_from_loaders, aget_choices,
+                                  aprepare_choices, atemplate_exists, resolved,
+                                  then)
+from templateselector.fields import (TemplateChoiceField, choices_cache,
+                                     get_templates_from_loaders,
+                                     nice_display_name)
+from templateselector.inventory import inventory
+
+
+@pytest.yield_fixture
+def run():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop.run_until_complete
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+@pytest.yield_fixture
+def scan_threads(record_calls):
+    inventory.clear()
+    yield record_calls(inventory_module, 'get_results_from_registry',
+                       lambda loaders, prefix='': threading.current_thread())
+    inventory.clear()
+
+
+def test_listing_shared_with_sync_cache(run, scan_threads):
+    results = run(aget_templates_from_loaders())
+    assert results == list(get_templates_from_loaders())
+    assert len(scan_threads) == 1
+    assert scan_threads[0] is not threading.current_thread()
+
+
+def test_listing_with_prefix(run, scan_threads):
+    results = run(aget_templates_from_loaders(prefix='admin/edit_inline/'))
+    assert results == ['admin/edit_inline/stacked.html',
+                       'admin/edit_inline/tabular.html']
+
+
+def test_choices(run, scan_threads):
+    results = run(aget_choices("^admin/[0-9]+.html$"))
+    field = TemplateChoiceField(match="^admin/[0-9]+.html$")
+    assert results == tuple(field.choices)
+    assert len(scan_threads) == 1
+
+
+def test_choices_use_active_language(run, scan_threads):
+    with translation.override('de'):
+        results = run(aget_choices("^admin/[0-9]+.html$"))
+        cached = choices_cache.get_choices("^admin/[0-9]+.html$",
+                                           nice_display_name)
+    # the executor thread built them for the same language, so they're shared.
+    assert results is cached
+
+
+def test_prepare_choices(run, scan_threads):
+    field = TemplateChoiceField(match="^admin/[0-9]+.html$")
+    run(aprepare_choices(field))
+    assert field.choices.evaluated is True
+    list(field.choices)
+    assert field.choices.evaluations == 1
+    assert scan_threads[0] is not threading.current_thread()
+
+
+def test_template_exists(run, scan_threads):
+    assert run(atemplate_exists('admin/index.html')) is True
+    assert run(atemplate_exists('admin/in2dex.html')) is False
+    assert scan_threads == []
+    run(aget_templates_from_loaders())
+    assert run(atemplate_exists('admin/index.html')) is True
+    assert run(atemplate_exists('admin/in2dex.html')) is False
+
+
+def test_errors_are_passed_along(run):
+    with pytest.raises(ZeroDivisionError):
+        run(then(resolved(1), lambda value: value / 0))
+    with pytest.raises(ZeroDivisionError):
+        run(then(then(resolved(1), lambda value: value / 0), lambda value: value))
@@ -11,8 +11,10 @@ from django.contrib import admin
 from django.core.exceptions import ImproperlyConfigured
 from django.forms import Form, IntegerField, modelform_factory
 from django.test import override_settings, SimpleTestCase
+from django.utils import translation
 from django.utils.encoding import force_text
-from templateselector.fields import TemplateChoiceField
+from templateselector import fields
+from templateselector.fields import TemplateChoiceField, ChoicesCache
 from templateselector.widgets import TemplateSelector, AdminTemplateSelector
 
 
@@ -149,7 +151,7 @@ class WidgetPreselectionTestCase(SimpleTestCase):
     def test_no_pre_selecting_occurs_for_more_than_one_choice(self):
         class MyForm(Form):
             field = TemplateChoiceField(
-                match="^django/forms/widgets/template_.+\.html$",
+                match=r"^django/forms/widgets/template_.+\.html$",
                 required=True)
 
         form = MyForm(data=None)
@@ -172,7 +174,7 @@ class WidgetPreselectionTestCase(SimpleTestCase):
     def test_no_pre_selecting_happens_for_bound_forms(self):
         class MyForm(Form):
             field = TemplateChoiceField(
-                match="^django/forms/widgets/template_.+\.html$",
+                match=r"^django/forms/widgets/template_.+\.html$",
                 required=False)
 
         form = MyForm(data={'field': 'django/forms/widgets/template_selector_option.html'})
@@ -182,7 +184,7 @@ class WidgetPreselectionTestCase(SimpleTestCase):
 
 
 def test_no_duplicates():
-    field = TemplateChoiceField(match="^django/forms/widgets/template_.+\.html$")
+    field = TemplateChoiceField(match=r"^django/forms/widgets/template_.+\.html$")
     assert list(field.choices) == [
         (u'django/forms/widgets/template_selector.html', u'Template selector'),
         (u'django/forms/widgets/template_selector_option.html', u'Template selector option'),
@@ -199,3 +201,158 @@ def test_form_validation_supercedes_model_validation_when_used_together(rf, mode
     assert form.errors == {
         'f': ['Select a valid choice. admin/should_not_exist.json is not one of the available choices.']
     }
+
+
+def test_choices_are_shared_between_fields(builds):
+    x = TemplateChoiceField(match="^admin/[0-9]+.html$")
+    y = TemplateChoiceField(match="^admin/[0-9]+.html$")
+    assert list(x.choices) == list(y.choices)
+    assert list(form_cls()().fields['b'].choices) == list(x.choices)
+    assert builds == ["^admin/[0-9]+.html$"]
+
+
+def test_choices_are_immutable(builds):
+    first = fields.choices_cache.get_choices("^admin/[0-9]+.html$",
+                                             fields.nice_display_name)
+    second = fields.choices_cache.get_choices("^admin/[0-9]+.html$",
+                                              fields.nice_display_name)
+    assert isinstance(first, tuple)
+    assert first is second
+
+
+def test_choices_are_built_per_display_name(builds):
+    def namer(data):
+        return data
+    x = TemplateChoiceField(match="^admin/[0-9]+.html$")
+    y = TemplateChoiceField(match="^admin/[0-9]+.html$", display_name=namer)
+    assert set(x.choices) != set(y.choices)
+    assert len(builds) == 2
+
+
+def test_choices_are_built_per_language(builds):
+    x = TemplateChoiceField(match="^admin/[0-9]+.html$")
+    with translation.override('en'):
+        list(x.choices)
+        list(x.choices)
+    with translation.override('de'):
+        list(x.choices)
+    assert len(builds) == 2
+
+
+def test_choices_cache_is_bounded(builds):
+    cache = ChoicesCache(maxsize=2)
+    cache.get_choices("^admin/404.html$", fields.nice_display_name)
+    cache.get_choices("^admin/500.html$", fields.nice_display_name)
+    cache.get_choices("^admin/404.html$", fields.nice_display_name)
+    cache.get_choices("^admin/index.html$", fields.nice_display_name)
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (1, 3)
+    # 500 was the least recently used, so should've been thrown away.
+    cache.get_choices("^admin/404.html$", fields.nice_display_name)
+    cache.get_choices("^admin/500.html$", fields.nice_display_name)
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+class ChoicesEvaluatedOnceTestCase(SimpleTestCase):
+    @skipIf(django.VERSION[0:2] < (1, 11), "won't render properly in Django pre-template-widgets")
+    def test_render_and_validate_evaluates_choices_once(self):
+        form = form_cls()(data={'a': '1', 'b': 'admin/404.html'})
+        field = form.fields['b']
+        assert field.widget.choices is field.choices
+        force_text(form['b'])
+        assert form.is_valid() is True
+        force_text(form['b'])
+        assert field.choices.evaluations == 1
+
+    @skipIf(django.VERSION[0:2] < (1, 11), "won't render properly in Django pre-template-widgets")
+    def test_unbound_required_render_evaluates_choices_once(self):
+        class MyForm(Form):
+            field = TemplateChoiceField(
+                match="^django/forms/widgets/template_selector.html$",
+                required=True)
+        form = MyForm(data=None)
+        force_text(form['field'])
+        assert form.fields['field'].choices.evaluations == 1
+
+    def test_each_form_instance_evaluates_separately(self):
+        cls = form_cls()
+        first = cls(data={'a': '1', 'b': 'admin/404.html'})
+        second = cls(data={'a': '1', 'b': 'admin/404.html'})
+        assert first.is_valid() is True
+        assert second.is_valid() is True
+        assert first.fields['b'].choices is not second.fields['b'].choices
+        assert first.fields['b'].choices.evaluations == 1
+        assert second.fields['b'].choices.evaluations == 1
+        assert cls.base_fields['b'].choices.evaluations == 0
+
+    def test_clearing_caches_evaluates_again(self):
+        field = TemplateChoiceField(match="^admin/[0-9]+.html$")
+        list(field.choices)
+        list(field.choices)
+        fields.choices_cache.clear()
+        list(field.choices)
+        assert field.choices.evaluations == 2
+
+
+def test_prepare_value_only_looks_for_a_second_match(monkeypatch):
+    names = []
+    def namer(data):
+        names.append(data)
+        return data
+    consumed = []
+    original = fields.get_templates_from_loaders
+    def counting(prefix=''):
+        for result in original(prefix=prefix):
+            consumed.append(result)
+            yield result
+    monkeypatch.setattr(fields, 'get_templates_from_loaders', counting)
+    field = TemplateChoiceField(match=r"^admin/.+\.html$", display_name=namer,
+                                required=True)
+    assert field.prepare_value(None) is None
+    assert names == []
+    assert field.choices.evaluations == 0
+    everything = [x for x in original(prefix='admin/')]
+    assert 2 <= len(consumed) < len(everything)
+
+
+def test_prepare_value_selects_only_match_without_evaluating():
+    field = TemplateChoiceField(
+        match="^django/forms/widgets/template_selector.html$", required=True)
+    value = field.prepare_value(None)
+    assert value == 'django/forms/widgets/template_selector.html'
+    assert field.choices.evaluations == 0
+
+
+def test_prepare_value_uses_evaluated_choices(monkeypatch):
+    field = TemplateChoiceField(
+        match="^django/forms/widgets/template_selector.html$", required=True)
+    list(field.choices)
+    def explode(*args, **kwargs):
+        raise AssertionError("Shouldn't have been called")
+    monkeypatch.setattr(fields, 'get_matching_templates', explode)
+    value = field.prepare_value(None)
+    assert value == 'django/forms/widgets/template_selector.html'
+    assert field.choices.evaluations == 1
+
+
+def test_nice_display_name():
+    assert fields.nice_display_name('test/app/hello_world.html') == 'Hello world'
+    assert fields.nice_display_name('admin/500.html') == 'Internal Server Error'
+
+
+def test_nice_display_name_is_cached_per_language():
+    fields.get_nice_display_name.cache_clear()
+    with translation.override('en'):
+        fields.nice_display_name('test/app/hello_world.html')
+        fields.nice_display_name('test/app/hello_world.html')
+    with translation.override('de'):
+        fields.nice_display_name('test/app/hello_world.html')
+    info = fields.get_nice_display_name.cache_info()
+    assert (info.hits, info.misses) == (1, 2)
+
+
+def test_nice_display_name_follows_setting_changes():
+    assert fields.nice_display_name('admin/404.html') == '404'
+    with override_settings(TEMPLATESELECTOR_DISPLAY_NAMES={'admin/404.html': 'Gone'}):
+        assert fields.nice_display_name('admin/404.html') == 'Gone'
+    assert fields.nice_display_name('admin/404.html') == '404'
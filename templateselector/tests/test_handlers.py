@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import os
+
+import pytest
+from django.template import Engine
+from django.test import override_settings
+
+from templateselector.handlers import (get_match_prefix, scandir_recursive,
+                                       get_results_from_registry)
+
+
+@pytest.fixture
+def template_dir(tmpdir):
+    for path in ('a.html', 'myapp/b.html', 'myapp/layouts/c.html',
+                 'myapp/layouts/deeper/d.html', 'other/e.html'):
+        tmpdir.join(*path.split('/')).ensure(file=True)
+    return tmpdir
+
+
+@pytest.fixture
+def loaders(template_dir):
+    engine = Engine(dirs=[str(template_dir)], loaders=[
+        'django.template.loaders.filesystem.Loader',
+    ])
+    return engine.template_loaders
+
+
+@pytest.mark.parametrize('regex,prefix', (
+    (r'^myapp/mypage/layouts/.+\.html$', 'myapp/mypage/layouts/'),
+    ('^admin/[0-9]+.html$', 'admin/'),
+    ('^admin/404.html$', 'admin/'),
+    (r'^django/forms/widgets/template_.+\.html$', 'django/forms/widgets/'),
+    (r'^my\-app\/layouts/.*$', 'my-app/layouts/'),
+    ('^.*$', ''),
+    ('^myapp.html$', ''),
+    ('^myapp/?layouts/.*$', ''),
+    ('^myapp/layouts/?.*$', 'myapp/'),
+    ('^myapp/la*youts/.*$', 'myapp/'),
+    (r'^myapp/\w+/.*$', 'myapp/'),
+    ('^(myapp|other)/.*$', ''),
+    ('^myapp/.*|^other/.*$', ''),
+    ('^(?i)myapp/.*$', ''),
+    ('myapp/.*$', ''),
+))
+def test_get_match_prefix(regex, prefix):
+    assert get_match_prefix(regex) == prefix
+
+
+def test_results_without_prefix(loaders):
+    results = set(get_results_from_registry(loaders))
+    assert results == {'a.html', 'myapp/b.html', 'myapp/layouts/c.html',
+                       'myapp/layouts/deeper/d.html', 'other/e.html'}
+
+
+def test_results_only_search_the_prefix(loaders):
+    results = set(get_results_from_registry(loaders, prefix='myapp/layouts/'))
+    assert results == {'myapp/layouts/c.html', 'myapp/layouts/deeper/d.html'}
+
+
+def test_results_for_missing_prefix(loaders):
+    results = set(get_results_from_registry(loaders, prefix='nope/'))
+    assert results == set()
+
+
+@pytest.yield_fixture
+def pools(record_calls):
+    from templateselector import handlers
+    yield record_calls(handlers, 'ThreadPool', lambda processes=None: processes)
+
+
+def test_concurrent_results_match_serial(loaders, pools):
+    serial = list(get_results_from_registry(loaders))
+    with override_settings(TEMPLATESELECTOR_SCAN_WORKERS=4,
+                           TEMPLATESELECTOR_SCAN_THRESHOLD=1):
+        concurrent = list(get_results_from_registry(loaders))
+    assert concurrent == serial
+    assert len(pools) == 1
+
+
+def test_concurrent_with_prefix(loaders, pools):
+    with override_settings(TEMPLATESELECTOR_SCAN_WORKERS=4,
+                           TEMPLATESELECTOR_SCAN_THRESHOLD=1):
+        results = set(get_results_from_registry(loaders, prefix='myapp/'))
+    assert results == {'myapp/b.html', 'myapp/layouts/c.html',
+                       'myapp/layouts/deeper/d.html'}
+
+
+def test_small_trees_are_walked_serially(loaders, pools):
+    with override_settings(TEMPLATESELECTOR_SCAN_WORKERS=4):
+        results = set(get_results_from_registry(loaders))
+    assert len(results) == 5
+    assert pools == []
+
+
+@pytest.fixture
+def messy_loaders(template_dir):
+    for path in ('.git/HEAD', 'node_modules/x/y.html', '__pycache__/z.pyc',
+                 'myapp/a.png', 'myapp/.DS_Store', 'other/node_modules/q.html'):
+        template_dir.join(*path.split('/')).ensure(file=True)
+    engine = Engine(dirs=[str(template_dir)], loaders=[
+        'django.template.loaders.filesystem.Loader',
+    ])
+    return engine.template_loaders
+
+
+def test_excluded_directories_are_skipped(messy_loaders):
+    results = set(get_results_from_registry(messy_loaders))
+    assert results == {'a.html', 'myapp/b.html', 'myapp/layouts/c.html',
+                       'myapp/layouts/deeper/d.html', 'other/e.html',
+                       'myapp/a.png', 'myapp/.DS_Store'}
+
+
+def test_exclusions_can_be_changed(messy_loaders):
+    with override_settings(TEMPLATESELECTOR_EXCLUDE_DIRS=('myapp',)):
+        results = set(get_results_from_registry(messy_loaders))
+    assert results == {'a.html', 'other/e.html', '.git/HEAD',
+                       'node_modules/x/y.html', '__pycache__/z.pyc',
+                       'other/node_modules/q.html'}
+
+
+def test_extensions_allow_list(messy_loaders):
+    with override_settings(TEMPLATESELECTOR_EXTENSIONS=('.html', '.txt')):
+        results = set(get_results_from_registry(messy_loaders))
+        with override_settings(TEMPLATESELECTOR_SCAN_WORKERS=4,
+                               TEMPLATESELECTOR_SCAN_THRESHOLD=1):
+            concurrent = set(get_results_from_registry(messy_loaders))
+    assert results == {'a.html', 'myapp/b.html', 'myapp/layouts/c.html',
+                       'myapp/layouts/deeper/d.html', 'other/e.html'}
+    assert concurrent == results
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason="needs symlinks")
+def test_following_symlinks_avoids_cycles(template_dir, loaders):
+    os.symlink(str(template_dir.join('myapp')),
+               str(template_dir.join('myapp', 'layouts', 'loop')))
+    os.symlink(str(template_dir.join('other')),
+               str(template_dir.join('linked')))
+    assert set(get_results_from_registry(loaders)) == {
+        'a.html', 'myapp/b.html', 'myapp/layouts/c.html',
+        'myapp/layouts/deeper/d.html', 'other/e.html'}
+    with override_settings(TEMPLATESELECTOR_FOLLOW_SYMLINKS=True):
+        results = set(get_results_from_registry(loaders))
+    # the same directory is only walked once, whichever way it's found first.
+    linked = results & {'other/e.html', 'linked/e.html'}
+    assert len(linked) == 1
+    assert results - linked == {'a.html', 'myapp/b.html', 'myapp/layouts/c.html',
+                                'myapp/layouts/deeper/d.html'}
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason="needs symlinks")
+def test_concurrent_symlink_cycles_match_serial(template_dir, loaders):
+    os.symlink(str(template_dir.join('myapp')),
+               str(template_dir.join('myapp', 'layouts', 'loop')))
+    os.symlink(str(template_dir), str(template_dir.join('other', 'root')))
+    with override_settings(TEMPLATESELECTOR_FOLLOW_SYMLINKS=True):
+        serial = list(get_results_from_registry(loaders))
+        with override_settings(TEMPLATESELECTOR_SCAN_WORKERS=4,
+                               TEMPLATESELECTOR_SCAN_THRESHOLD=1):
+            concurrent = list(get_results_from_registry(loaders))
+    assert concurrent == serial
+    assert sorted(serial) == ['a.html', 'myapp/b.html', 'myapp/layouts/c.html',
+                              'myapp/layouts/deeper/d.html', 'other/e.html']
+
+
+def test_prefixes_skipped_by_the_whole_walk(messy_loaders, tmpdir_factory):
+    for prefix in ('node_modules/', 'node_modules/x/', 'other/node_modules/'):
+        assert list(get_results_from_registry(messy_loaders, prefix=prefix)) == []
+    if hasattr(os, 'symlink'):
+        theme = tmpdir_factory.mktemp('theme')
+        theme.join('t.html').ensure(file=True)
+        directory = messy_loaders[0].get_dirs()[0]
+        os.symlink(str(theme), os.path.join(directory, 'theme'))
+        results = list(get_results_from_registry(messy_loaders))
+        assert 'theme/t.html' not in results
+        assert list(get_results_from_registry(messy_loaders, prefix='theme/')) == []
+        with override_settings(TEMPLATESELECTOR_FOLLOW_SYMLINKS=True):
+            results = list(get_results_from_registry(messy_loaders))
+            assert 'theme/t.html' in results
+            assert list(get_results_from_registry(messy_loaders, prefix='theme/')) == [
+                'theme/t.html']
+
+
+def test_walk_is_depth_first(template_dir):
+    paths = [item.path[len(str(template_dir))+1:]
+             for item in scandir_recursive(str(template_dir))]
+    for index, path in enumerate(paths):
+        parent = os.path.dirname(path)
+        if parent:
+            assert parent in paths[:index]
+    assert len(paths) == 9
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import threading
+import time
+
+import pytest
+from django.conf import settings
+from django.template import engines
+from django.test import override_settings
+
+from templateselector import fields, inventory as inventory_module
+from templateselector.fields import get_templates_from_loaders
+from templateselector.inventory import (TemplateInventory, TemplateListing,
+                                        inventory)
+
+
+def test_listing_is_built_once(scans):
+    first = tuple(get_templates_from_loaders())
+    second = tuple(get_templates_from_loaders())
+    assert first == second
+    assert 'admin/index.html' in first
+    assert len(scans) == len(engines.all())
+
+
+def test_listing_has_no_duplicates(scans):
+    results = tuple(get_templates_from_loaders())
+    assert len(results) == len(set(results))
+
+
+def test_explicit_clear_causes_rescan(scans):
+    tuple(get_templates_from_loaders())
+    version = inventory.version
+    inventory.clear()
+    assert inventory.version == version + 1
+    assert len(inventory) == 0
+    tuple(get_templates_from_loaders())
+    assert len(scans) == 2
+
+
+def test_changing_templates_setting_causes_rescan(scans):
+    tuple(get_templates_from_loaders())
+    templates = [dict(settings.TEMPLATES[0], APP_DIRS=False)]
+    with override_settings(TEMPLATES=templates):
+        results = tuple(get_templates_from_loaders())
+        assert 'admin/index.html' not in results
+        assert 'django/forms/widgets/template_selector.html' in results
+    assert 'admin/index.html' in tuple(get_templates_from_loaders())
+    assert len(scans) == 3
+
+
+def test_keyed_by_engine_and_loaders():
+    engine = engines.all()[0]
+    key = TemplateInventory().get_key(engine)
+    assert key[0] == engine.name
+    assert hash(key) == hash(TemplateInventory().get_key(engine))
+    flattened = repr(key)
+    assert 'django.template.loaders.filesystem' in flattened
+    assert 'django.template.loaders.app_directories' in flattened
+
+
+def test_prefix_only_scans_that_directory(scans):
+    results = tuple(get_templates_from_loaders(prefix='admin/edit_inline/'))
+    assert results == ('admin/edit_inline/stacked.html',
+                       'admin/edit_inline/tabular.html')
+    assert len(scans) == len(engines.all())
+
+
+def test_prefix_uses_existing_parent_listing(scans):
+    everything = tuple(get_templates_from_loaders())
+    results = tuple(get_templates_from_loaders(prefix='admin/edit_inline/'))
+    assert len(scans) == len(engines.all())
+    assert results == tuple(x for x in everything
+                            if x.startswith('admin/edit_inline/'))
+
+
+def test_prefix_listing_not_used_for_other_prefixes(scans):
+    tuple(get_templates_from_loaders(prefix='admin/edit_inline/'))
+    results = tuple(get_templates_from_loaders(prefix='admin/'))
+    assert 'admin/index.html' in results
+    assert 'admin/edit_inline/tabular.html' in results
+    assert len(scans) == 2 * len(engines.all())
+
+
+def test_listing_membership_and_prefixes():
+    listing = TemplateListing(['b/2.html', 'a/1.html', 'b/1.html', 'a/1.html',
+                               'c.html'])
+    assert listing == ('a/1.html', 'b/1.html', 'b/2.html', 'c.html')
+    assert 'b/1.html' in listing
+    assert 'b/3.html' not in listing
+    assert 'd.html' not in listing
+    assert tuple(listing.with_prefix('b/')) == ('b/1.html', 'b/2.html')
+    assert tuple(listing.with_prefix('')) == listing
+    assert tuple(listing.with_prefix('z/')) == ()
+
+
+def run_concurrently(func, count=16):
+    start = threading.Event()
+    results = []
+    def worker():
+        start.wait()
+        results.append(func())
+    threads = [threading.Thread(target=worker) for x in range(count)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_cold_builds_scan_once(slow_scans):
+    for invalidation in range(3):
+        inventory.clear()
+        results = run_concurrently(lambda: tuple(get_templates_from_loaders()))
+        assert len(set(results)) == 1
+        assert len(slow_scans) == (invalidation + 1) * len(engines.all())
+
+
+def test_concurrent_prefix_builds_scan_once(slow_scans):
+    results = run_concurrently(
+        lambda: tuple(get_templates_from_loaders(prefix='admin/edit_inline/')))
+    assert set(results) == {('admin/edit_inline/stacked.html',
+                             'admin/edit_inline/tabular.html')}
+    assert len(slow_scans) == len(engines.all())
+
+
+def test_previous_listing_served_while_rebuilding(monkeypatch):
+    inventory.clear()
+    before = tuple(get_templates_from_loaders())
+    inventory.clear()
+    building = threading.Event()
+    release = threading.Event()
+    original = inventory_module.get_results_from_registry
+    def blocking(loaders, **kwargs):
+        building.set()
+        release.wait()
+        return ['only/one.html']
+    monkeypatch.setattr(inventory_module, 'get_results_from_registry', blocking)
+    builder = threading.Thread(target=lambda: tuple(get_templates_from_loaders()))
+    builder.start()
+    try:
+        assert building.wait(5)
+        assert tuple(get_templates_from_loaders()) == before
+    finally:
+        release.set()
+        builder.join()
+    assert tuple(get_templates_from_loaders()) == ('only/one.html',)
+    monkeypatch.setattr(inventory_module, 'get_results_from_registry', original)
+    inventory.clear()
+
+
+def test_concurrent_choices_build_once(slow_builds):
+    for invalidation in range(3):
+        fields.choices_cache.clear()
+        results = run_concurrently(lambda: fields.choices_cache.get_choices(
+            "^admin/[0-9]+.html$", fields.nice_display_name))
+        assert len(set(id(x) for x in results)) == 1
+        assert len(slow_builds) == invalidation + 1
+
+
+def wait_for_refreshes(name='templateselector-refresh'):
+    for thread in threading.enumerate():
+        if thread.name == name:
+            thread.join()
+
+
+@pytest.yield_fixture
+def changing_templates(monkeypatch):
+    found = [['a.html']]
+    calls = []
+    def fake(loaders, **kwargs):
+        calls.append(loaders)
+        for name in found[0]:
+            yield name
+    monkeypatch.setattr(inventory_module, 'get_results_from_registry', fake)
+    inventory.clear()
+    inventory.clear()
+    yield found, calls
+    wait_for_refreshes()
+    inventory.clear()
+    inventory.clear()
+
+
+def test_stale_listing_is_served_while_refreshing(changing_templates):
+    found, calls = changing_templates
+    with override_settings(TEMPLATESELECTOR_REFRESH_AFTER=0):
+        assert tuple(inventory.get_templates()) == ('a.html',)
+        version = inventory.version
+        found[0] = ['a.html', 'b.html']
+        assert tuple(inventory.get_templates()) == ('a.html',)
+        wait_for_refreshes()
+        assert inventory.version == version + 1
+        assert tuple(inventory.get_templates()) == ('a.html', 'b.html')
+        wait_for_refreshes()
+        # nothing changed that time.
+        assert inventory.version == version + 1
+
+
+def test_fresh_listing_is_not_refreshed(changing_templates):
+    found, calls = changing_templates
+    with override_settings(TEMPLATESELECTOR_REFRESH_AFTER=60):
+        tuple(inventory.get_templates())
+        tuple(inventory.get_templates())
+        wait_for_refreshes()
+    assert len(calls) == len(engines.all())
+
+
+def test_cleared_listing_is_served_while_refreshing(changing_templates):
+    found, calls = changing_templates
+    with override_settings(TEMPLATESELECTOR_REFRESH_AFTER=60):
+        tuple(inventory.get_templates())
+        inventory.clear()
+        found[0] = ['c.html']
+        assert tuple(inventory.get_templates()) == ('a.html',)
+        wait_for_refreshes()
+        assert tuple(inventory.get_templates()) == ('c.html',)
+
+
+def test_refresh_past_deadline_keeps_listing(changing_templates, monkeypatch):
+    found, calls = changing_templates
+    def slow(loaders, **kwargs):
+        calls.append(loaders)
+        for name in ('x.html', 'y.html', 'z.html'):
+            time.sleep(0.05)
+            yield name
+    with override_settings(TEMPLATESELECTOR_REFRESH_AFTER=0,
+                           TEMPLATESELECTOR_REFRESH_DEADLINE=0.01):
+        tuple(inventory.get_templates())
+        version = inventory.version
+        monkeypatch.setattr(inventory_module, 'get_results_from_registry', slow)
+        assert tuple(inventory.get_templates()) == ('a.html',)
+        wait_for_refreshes()
+        assert tuple(inventory.get_templates()) == ('a.html',)
+        wait_for_refreshes()
+    assert inventory.version == version
+
+
+def test_stuck_refresh_is_abandoned(changing_templates, monkeypatch):
+    found, calls = changing_templates
+    stuck = threading.Event()
+    hung = []
+    original = inventory_module.get_results_from_registry
+    def hanging(loaders, **kwargs):
+        if not hung:
+            hung.append(loaders)
+            stuck.wait()
+            found[0] = ['late.html']
+        return original(loaders, **kwargs)
+    with override_settings(TEMPLATESELECTOR_REFRESH_AFTER=0,
+                           TEMPLATESELECTOR_REFRESH_DEADLINE=0.05):
+        tuple(inventory.get_templates())
+        monkeypatch.setattr(inventory_module, 'get_results_from_registry', hanging)
+        try:
+            assert tuple(inventory.get_templates()) == ('a.html',)
+            wait_for_refreshes('templateselector-refresh-deadline')
+            assert inventory._refreshing == {}
+            # a new refresh can start, and completes.
+            found[0] = ['b.html']
+            tuple(inventory.get_templates())
+            wait_for_refreshes('templateselector-refresh-deadline')
+            assert 'b.html' in tuple(inventory.get_templates())
+        finally:
+            stuck.set()
+        wait_for_refreshes()
+        # what the abandoned refresh found was thrown away.
+        assert 'late.html' not in tuple(inventory.get_templates())
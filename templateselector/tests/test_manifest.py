@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import json
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command, CommandError
+from django.test import override_settings
+from django.utils.six import StringIO
+
+from templateselector import inventory as inventory_module
+from templateselector.fields import (TemplateChoiceField,
+                                     get_templates_from_loaders)
+from templateselector.inventory import inventory
+from templateselector.manifest import (MANIFEST_VERSION, MAPPED_MAGIC,
+                                       MappedListing, get_manifest_key,
+                                       read_manifest, write_mapped_manifest)
+
+
+@pytest.yield_fixture
+def manifest_path(tmpdir):
+    path = str(tmpdir.join('manifest.json'))
+    out = StringIO()
+    call_command('templateselector_manifest', output=path, stdout=out)
+    assert 'Wrote ' in out.getvalue()
+    inventory.clear()
+    yield path
+    inventory.clear()
+
+
+@pytest.yield_fixture
+def no_scanning(monkeypatch):
+    def explode(*args, **kwargs):
+        raise AssertionError("Shouldn't have searched the template directories")
+    monkeypatch.setattr(inventory_module, 'get_results_from_registry', explode)
+    yield
+
+
+def test_listing_comes_from_manifest(manifest_path, no_scanning):
+    with override_settings(TEMPLATESELECTOR_MANIFEST=manifest_path):
+        results = tuple(get_templates_from_loaders())
+        assert 'admin/index.html' in results
+        field = TemplateChoiceField(match="^admin/[0-9]+.html$")
+        assert set(x[0] for x in field.choices) == {'admin/404.html',
+                                                    'admin/500.html'}
+
+
+def test_manifest_content_is_used(manifest_path, no_scanning):
+    with open(manifest_path) as f:
+        data = json.load(f)
+    data['engines'][0]['templates'].append('admin/999.html')
+    with open(manifest_path, 'w') as f:
+        json.dump(data, f)
+    with override_settings(TEMPLATESELECTOR_MANIFEST=manifest_path):
+        assert 'admin/999.html' in tuple(get_templates_from_loaders())
+
+
+def test_unknown_loaders_are_searched(manifest_path):
+    with open(manifest_path) as f:
+        data = json.load(f)
+    data['engines'][0]['engine'] = 'something_else'
+    with open(manifest_path, 'w') as f:
+        json.dump(data, f)
+    with override_settings(TEMPLATESELECTOR_MANIFEST=manifest_path):
+        assert 'admin/index.html' in tuple(get_templates_from_loaders())
+
+
+def test_moved_directories_are_warned_about(manifest_path, caplog):
+    with open(manifest_path) as f:
+        data = json.load(f)
+    for entry in data['engines']:
+        entry['loaders'] = json.loads(json.dumps(entry['loaders']).replace(
+            '/', '/elsewhere/'))
+    with open(manifest_path, 'w') as f:
+        json.dump(data, f)
+    with override_settings(TEMPLATESELECTOR_MANIFEST=manifest_path):
+        assert 'admin/index.html' in tuple(get_templates_from_loaders())
+    assert [x.getMessage() for x in caplog.records
+            if x.name == 'templateselector.inventory'] == [
+        "None of the engines in the TEMPLATESELECTOR_MANIFEST file {!r} match "
+        "the current template settings (have the template directories moved "
+        "since it was written?), so the directories will be searched "
+        "instead".format(manifest_path)]
+
+
+def test_matching_manifest_isnt_warned_about(manifest_path, caplog):
+    with override_settings(TEMPLATESELECTOR_MANIFEST=manifest_path):
+        tuple(get_templates_from_loaders())
+    assert [x for x in caplog.records if x.name == 'templateselector.inventory'] == []
+
+
+def test_missing_manifest(tmpdir):
+    path = str(tmpdir.join('nope.json'))
+    with override_settings(TEMPLATESELECTOR_MANIFEST=path):
+        with pytest.raises(ImproperlyConfigured):
+            tuple(get_templates_from_loaders())
+
+
+def test_command_needs_somewhere_to_write():
+    with pytest.raises(CommandError):
+        call_command('templateselector_manifest')
+
+
+@pytest.yield_fixture
+def mapped_manifest_path(tmpdir):
+    path = str(tmpdir.join('manifest.bin'))
+    call_command('templateselector_manifest', output=path, format='mmap',
+                 stdout=StringIO())
+    inventory.clear()
+    yield path
+    inventory.clear()
+
+
+def test_listing_comes_from_mapped_manifest(mapped_manifest_path, no_scanning):
+    with override_settings(TEMPLATESELECTOR_MANIFEST=mapped_manifest_path):
+        results = tuple(get_templates_from_loaders())
+        assert 'admin/index.html' in results
+        assert results == tuple(sorted(set(results)))
+        inline = tuple(get_templates_from_loaders(prefix='admin/edit_inline/'))
+        assert inline == ('admin/edit_inline/stacked.html',
+                          'admin/edit_inline/tabular.html')
+        assert inventory.exists('admin/index.html') is True
+        assert inventory.exists('admin/in2dex.html') is False
+        field = TemplateChoiceField(match="^admin/[0-9]+.html$")
+        assert set(x[0] for x in field.choices) == {'admin/404.html',
+                                                    'admin/500.html'}
+
+
+def test_mapped_listing(tmpdir):
+    names = ['b/2.html', 'a/1.html', 'b/1.html', 'c.html', 'b/é.html',
+             'ba.html']
+    manifest = {'version': MANIFEST_VERSION, 'engines': [
+        {'engine': 'x', 'loaders': [], 'templates': names},
+        {'engine': 'y', 'loaders': [], 'templates': ['z.html']},
+    ]}
+    path = str(tmpdir.join('manifest.bin'))
+    write_mapped_manifest(path, manifest)
+    listings = read_manifest(path)
+    listing = listings[get_manifest_key('x', [])]
+    assert len(listing) == 6
+    assert tuple(listing) == tuple(sorted(names))
+    for name in names:
+        assert name in listing
+    for name in ('', 'a', 'b/', 'b/3.html', 'd.html', 'z.html', '0.html'):
+        assert name not in listing
+    assert tuple(listing.with_prefix('b/')) == ('b/1.html', 'b/2.html',
+                                                'b/é.html')
+    assert tuple(listing.with_prefix('q/')) == ()
+    assert tuple(listing.with_prefix('')) == tuple(listing)
+    assert tuple(listings[get_manifest_key('y', [])]) == ('z.html',)
+
+
+def test_rewritten_mapped_manifest_is_still_readable(tmpdir):
+    manifest = {'version': MANIFEST_VERSION, 'engines': [
+        {'engine': 'x', 'loaders': [], 'templates': ['a.html', 'b.html']},
+    ]}
+    path = str(tmpdir.join('manifest.bin'))
+    write_mapped_manifest(path, manifest)
+    listing = read_manifest(path)[get_manifest_key('x', [])]
+    manifest['engines'][0]['templates'] = []
+    write_mapped_manifest(path, manifest)
+    assert 'b.html' in listing
+    assert tuple(listing) == ('a.html', 'b.html')
+    assert tuple(read_manifest(path)[get_manifest_key('x', [])]) == ()
+    assert tmpdir.listdir() == [tmpdir.join('manifest.bin')]
+
+
+def test_mapped_listing_without_trailing_newline():
+    listing = MappedListing(b'a.html\nb.html', 0, 13, 2)
+    assert tuple(listing) == ('a.html', 'b.html')
+    assert 'b.html' in listing
+    assert 'c.html' not in listing
+
+
+def test_truncated_mapped_manifest(tmpdir):
+    manifest = {'version': MANIFEST_VERSION, 'engines': [
+        {'engine': 'x', 'loaders': [], 'templates': ['a.html', 'b.html']},
+    ]}
+    path = tmpdir.join('manifest.bin')
+    write_mapped_manifest(str(path), manifest)
+    data = path.read_binary()
+    for length in (len(data) - 1, data.index(b'\n', len(MAPPED_MAGIC))):
+        path.write_binary(data[:length])
+        with pytest.raises(ImproperlyConfigured):
+            read_manifest(str(path))
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import pytest
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management import call_command
+from django.http import Http404
+from django.test import RequestFactory, override_settings
+from django.utils.six import StringIO
+
+from templateselector import views
+from templateselector.fields import (TemplateChoiceField,
+                                     TemplateExistsValidator, choices_cache)
+from templateselector.inventory import inventory
+from templateselector.metrics import (CONTENT_TYPE, Counter, Histogram,
+                                      is_enabled, metrics)
+
+
+@pytest.yield_fixture
+def collecting():
+    inventory.clear()
+    choices_cache.clear()
+    metrics.clear()
+    with override_settings(TEMPLATESELECTOR_METRICS=True):
+        yield metrics
+    metrics.clear()
+
+
+def staff_request():
+    request = RequestFactory().get('/metrics/')
+    request.user = User(username='staff', is_staff=True, is_active=True)
+    return request
+
+
+def test_counter_and_histogram_samples():
+    counter = Counter('things_total', "Things", ('kind',))
+    counter.inc(kind='a')
+    counter.inc(2, kind='a"b')
+    assert list(counter.samples()) == [
+        ('things_total', (('kind', 'a'),), 1),
+        ('things_total', (('kind', 'a"b'),), 2),
+    ]
+    histogram = Histogram('took_seconds', "Took", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    assert [x[2] for x in histogram.samples()] == [1, 2, 3, 5.55, 3]
+
+
+def test_not_enabled_by_default():
+    assert not is_enabled()
+    request = staff_request()
+    with pytest.raises(Http404):
+        views.metrics(request)
+
+
+def test_collects_from_signals(collecting):
+    assert is_enabled()
+    for attempt in range(2):
+        field = TemplateChoiceField(match="^admin/[0-9]+.html$")
+        field.widget.render('template', None)
+    with pytest.raises(Exception):
+        TemplateExistsValidator("^admin/[0-9]+.html$")('admin/401.html')
+    assert collecting.cache_lookups.get(cache='choices', result='miss') == 1
+    assert collecting.cache_lookups.get(cache='choices', result='hit') == 1
+    assert collecting.inventory_builds.get() == 1
+    assert collecting.scanned_files.get() > 0
+    assert collecting.choices_duration.count == 1
+    assert collecting.render_duration.count == 2
+    assert collecting.validations.get(source='loader', result='invalid') == 1
+
+
+def test_view_renders_exposition_format(collecting):
+    tuple(TemplateChoiceField(match="^admin/[0-9]+.html$").choices)
+    response = views.metrics(staff_request())
+    assert response.status_code == 200
+    assert response['Content-Type'] == CONTENT_TYPE
+    body = response.content.decode('utf-8')
+    assert '# TYPE templateselector_scan_duration_seconds histogram' in body
+    assert 'templateselector_cache_lookups_total{cache="choices",result="miss"} 1.0' in body
+    assert 'templateselector_choices_build_duration_seconds_bucket{le="+Inf"} 1' in body
+
+
+def test_view_is_for_staff_only(collecting):
+    request = RequestFactory().get('/metrics/')
+    request.user = AnonymousUser()
+    response = views.metrics(request)
+    assert response.status_code == 302
+
+
+def test_disabled_by_setting(collecting):
+    with override_settings(TEMPLATESELECTOR_METRICS=False):
+        assert not is_enabled()
+        tuple(TemplateChoiceField(match="^admin/[0-9]+.html$").choices)
+    assert collecting.choices_duration.count == 0
+
+
+def test_command():
+    out = StringIO()
+    call_command('templateselector_metrics', stdout=out)
+    assert '# TYPE templateselector_inventory_builds_total counter' in out.getvalue()
+    assert 'templateselector_choices_build_duration_seconds_count ' in out.getvalue()
+    assert not is_enabled()
+    metrics.clear()
@@ -14,7 +14,10 @@ from django.test import override_settings
 from django.utils.encoding import force_text
 
 from templateselector.admin import TemplateFieldListFilter
-from templateselector.fields import TemplateField
+from templateselector.fields import TemplateField, get_templates_from_loaders
+from templateselector.inventory import inventory
+from templateselector.loading import MissingTemplateCache, missing_templates
+from templateselector.managers import prefetch_templates
 
 
 @pytest.yield_fixture
@@ -145,3 +148,183 @@ def test_pickling(modelcls):
     x = modelcls(f="admin/index.html")
     x.full_clean()
     pickle.loads(pickle.dumps(x))
+
+
+def test_validation_uses_warm_inventory(modelcls, get_template_calls):
+    with override_settings(TEMPLATESELECTOR_VALIDATE_FROM_INVENTORY=True):
+        tuple(get_templates_from_loaders())
+        modelcls(f="admin/index.html").full_clean()
+        with pytest.raises(ValidationError) as exc:
+            modelcls(f="admin/in2dex.html").full_clean()
+    assert 'admin/in2dex.html is not a valid template' in force_text(exc.value)
+    assert get_template_calls == []
+
+
+def test_validation_falls_back_for_cold_inventory(modelcls, get_template_calls):
+    with override_settings(TEMPLATESELECTOR_VALIDATE_FROM_INVENTORY=True):
+        inventory.clear()
+        modelcls(f="admin/index.html").full_clean()
+    assert get_template_calls == ["admin/index.html"]
+
+
+def test_validation_falls_back_for_unusual_names(modelcls, get_template_calls):
+    with override_settings(TEMPLATESELECTOR_VALIDATE_FROM_INVENTORY=True):
+        tuple(get_templates_from_loaders())
+        modelcls(f="admin/../admin/index.html").full_clean()
+    assert get_template_calls == ["admin/../admin/index.html"]
+
+
+def test_validation_falls_back_for_filtered_names(modelcls, get_template_calls):
+    with override_settings(TEMPLATESELECTOR_VALIDATE_FROM_INVENTORY=True,
+                           TEMPLATESELECTOR_EXTENSIONS=('.txt',),
+                           TEMPLATESELECTOR_EXCLUDE_DIRS=('edit_inline',)):
+        tuple(get_templates_from_loaders())
+        assert inventory.exists('admin/index.html') is None
+        assert inventory.exists('admin/edit_inline/tabular.txt') is None
+        modelcls(f="admin/index.html").full_clean()
+    assert get_template_calls == ["admin/index.html"]
+
+
+def test_validation_uses_loaders_by_default(modelcls, get_template_calls):
+    tuple(get_templates_from_loaders())
+    modelcls(f="admin/index.html").full_clean()
+    assert get_template_calls == ["admin/index.html"]
+
+
+def test_inventory_exists():
+    inventory.clear()
+    assert inventory.exists('admin/index.html') is None
+    tuple(get_templates_from_loaders(prefix='admin/edit_inline/'))
+    assert inventory.exists('admin/edit_inline/tabular.html') is True
+    assert inventory.exists('admin/edit_inline/nope.html') is False
+    assert inventory.exists('admin/index.html') is None
+    tuple(get_templates_from_loaders())
+    assert inventory.exists('admin/index.html') is True
+    assert inventory.exists('admin/in2dex.html') is False
+    assert inventory.exists('/admin/index.html') is None
+
+
+def test_missing_templates_are_remembered(modelcls, get_template_calls):
+    with override_settings(TEMPLATESELECTOR_MISSING_TEMPLATES_TIMEOUT=60):
+        hits = missing_templates.hits
+        for attempt in range(3):
+            with pytest.raises(ValidationError):
+                modelcls(f="admin/in2dex.html").full_clean()
+            with pytest.raises(TemplateDoesNotExist):
+                modelcls(f="admin/in2dex.html").get_f_instance()
+        assert missing_templates.hits - hits == 5
+    assert get_template_calls == ["admin/in2dex.html"]
+
+
+def test_missing_templates_forgotten_when_inventory_changes(modelcls, get_template_calls):
+    with override_settings(TEMPLATESELECTOR_MISSING_TEMPLATES_TIMEOUT=60):
+        with pytest.raises(TemplateDoesNotExist):
+            modelcls(f="admin/in2dex.html").get_f_instance()
+        inventory.clear()
+        with pytest.raises(TemplateDoesNotExist):
+            modelcls(f="admin/in2dex.html").get_f_instance()
+    assert get_template_calls == ["admin/in2dex.html", "admin/in2dex.html"]
+
+
+def test_missing_templates_cache_expires(monkeypatch):
+    from templateselector import loading
+    now = [100.0]
+    monkeypatch.setattr(loading, 'default_timer', lambda: now[0])
+    cache = MissingTemplateCache(maxsize=2, timeout=10)
+    cache.add('a.html')
+    assert 'a.html' in cache
+    now[0] = 111.0
+    assert 'a.html' not in cache
+    assert len(cache) == 0
+
+
+def test_missing_templates_clear_resets_hits():
+    cache = MissingTemplateCache(maxsize=2, timeout=None)
+    cache.add('a.html')
+    assert 'a.html' in cache
+    assert cache.hits == 1
+    cache.clear()
+    assert cache.hits == 0
+
+
+def test_missing_templates_cache_is_bounded():
+    cache = MissingTemplateCache(maxsize=2, timeout=None)
+    for name in ('a.html', 'b.html', 'c.html'):
+        cache.add(name)
+    assert len(cache) == 2
+    assert 'a.html' not in cache
+    assert 'c.html' in cache
+
+
+def test_missing_templates_disabled_by_default(modelcls, get_template_calls):
+    for attempt in range(2):
+        with pytest.raises(TemplateDoesNotExist):
+            modelcls(f="admin/in2dex.html").get_f_instance()
+    assert len(get_template_calls) == 2
+
+
+def test_template_instance_is_remembered(modelcls, get_template_calls):
+    x = modelcls(f="admin/index.html")
+    first = x.get_f_instance()
+    assert x.get_f_instance() is first
+    assert get_template_calls == ["admin/index.html"]
+
+
+def test_template_instance_forgotten_when_value_changes(modelcls, get_template_calls):
+    x = modelcls(f="admin/index.html")
+    first = x.get_f_instance()
+    x.f = "admin/404.html"
+    second = x.get_f_instance()
+    assert second is not first
+    assert second.template.name == "admin/404.html"
+    assert get_template_calls == ["admin/index.html", "admin/404.html"]
+
+
+def test_pickling_doesnt_include_template_instance(modelcls):
+    x = modelcls(f="admin/index.html")
+    x.get_f_instance()
+    y = pickle.loads(pickle.dumps(x))
+    assert y._f_template_cache.template is None
+    assert isinstance(y.get_f_instance(), Template)
+
+
+def test_compiled_templates_shared_between_instances_if_enabled(modelcls, get_template_calls):
+    with override_settings(TEMPLATESELECTOR_CACHE_COMPILED_TEMPLATES=True):
+        first = modelcls(f="admin/index.html").get_f_instance()
+        second = modelcls(f="admin/index.html").get_f_instance()
+        assert first is second
+    modelcls(f="admin/index.html").get_f_instance()
+    assert get_template_calls == ["admin/index.html", "admin/index.html"]
+
+
+@pytest.mark.django_db
+def test_prefetch_templates_loads_each_template_once(modelcls, get_template_calls):
+    for value in ("admin/index.html", "admin/404.html", "admin/index.html",
+                  "admin/index.html", "admin/404.html"):
+        modelcls.objects.create(f=value)
+    objs = list(modelcls.objects.prefetch_templates('f').order_by('pk'))
+    assert len(objs) == 5
+    assert sorted(get_template_calls) == ["admin/404.html", "admin/index.html"]
+    assert objs[0].get_f_instance() is objs[2].get_f_instance()
+    assert objs[1].get_f_instance() is objs[4].get_f_instance()
+    assert len(get_template_calls) == 2
+
+
+@pytest.mark.django_db
+def test_prefetch_templates_leaves_missing_templates(modelcls, get_template_calls):
+    modelcls.objects.create(f="admin/in2dex.html")
+    obj = modelcls.objects.filter(f="admin/in2dex.html").prefetch_templates('f').get()
+    with pytest.raises(TemplateDoesNotExist):
+        obj.get_f_instance()
+
+
+@pytest.mark.django_db
+def test_prefetch_templates_can_be_cleared(modelcls, get_template_calls):
+    modelcls.objects.create(f="admin/index.html")
+    list(modelcls.objects.prefetch_templates('f').prefetch_templates(None))
+    assert get_template_calls == []
+
+
+def test_prefetch_templates_only_for_template_fields(modelcls):
+    with pytest.raises(ValueError):
+        prefetch_templates([modelcls(f="admin/index.html")], 'id')
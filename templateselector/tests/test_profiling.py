@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+from django.core.management import call_command
+from django.template import engines
+from django.test import override_settings
+from django.utils.six import StringIO
+
+from templateselector.fields import TemplateChoiceField, nice_display_name
+from templateselector.handlers import get_results_from_registry
+from templateselector.profiling import profile_directories, profile_patterns
+
+
+def test_directories():
+    results = profile_directories()
+    loaders = engines['django'].engine.template_loaders
+    names = tuple(get_results_from_registry(loaders))
+    assert sum(x['files'] for x in results) == len(names)
+    assert sum(x['path_bytes'] for x in results) == sum(len(x.encode('utf-8'))
+                                                        for x in names)
+    assert all(x['directory'] and x['engine'] == 'django' for x in results)
+    assert {x['loader'] for x in results} == {
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader'}
+
+
+@override_settings(TEMPLATESELECTOR_SCAN_WORKERS=4)
+def test_directories_with_threads():
+    results = profile_directories()
+    assert {x['directory'] for x in results} == {None}
+    assert sum(x['files'] for x in results) > 0
+
+
+def test_patterns():
+    results = profile_patterns([("^admin/[0-9]+.html$", nice_display_name),
+                                ("^admin/404.html$", nice_display_name)])
+    assert [(x['prefix'], x['matched']) for x in results] == [('admin/', 2),
+                                                              ('admin/', 1)]
+    assert results[0]['scanned'] == results[1]['scanned']
+    assert 0 < results[0]['discarded'] < results[1]['discarded'] < 1
+
+
+def test_command():
+    field = TemplateChoiceField(match="^admin/[0-9]+.html$")
+    out = StringIO()
+    call_command('templateselector_profile', stdout=out)
+    output = out.getvalue()
+    assert 'Template directories:' in output
+    assert "^admin/[0-9]+.html$: 2 of " in output
+    assert "below 'admin/'" in output
+    del field
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import os
+import threading
+import time
+
+import pytest
+from django.test import override_settings
+from django.utils import translation
+
+from templateselector import fields, inventory as inventory_module
+from templateselector.fields import choices_cache
+from templateselector.inventory import inventory
+
+
+@pytest.fixture
+def template_dir(tmpdir):
+    templates = tmpdir.mkdir('templates')
+    for path in ('a.html', 'myapp/b.html', 'myapp/layouts/c.html'):
+        templates.join(*path.split('/')).ensure(file=True)
+    return templates
+
+
+@pytest.yield_fixture(params=['locmem', 'filebased'])
+def shared(request, tmpdir, template_dir, scans):
+    backend = 'django.core.cache.backends.{}.{}Cache'.format(
+        request.param, 'LocMem' if request.param == 'locmem' else 'FileBased')
+    caches = {
+        'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        'templates': {'BACKEND': backend, 'LOCATION': str(tmpdir.join('cache'))},
+    }
+    templates = [{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [str(template_dir)],
+    }]
+    with override_settings(CACHES=caches, TEMPLATES=templates,
+                           TEMPLATESELECTOR_CACHE='templates'):
+        yield scans
+    inventory.clear()
+    choices_cache.clear()
+
+
+def another_process():
+    inventory.clear()
+    choices_cache.clear()
+
+
+def test_listing_is_shared(shared):
+    first = tuple(inventory.get_templates())
+    another_process()
+    assert tuple(inventory.get_templates()) == first
+    assert tuple(inventory.get_templates(prefix='myapp/')) == (
+        'myapp/b.html', 'myapp/layouts/c.html')
+    # the prefix is answered from the listing for the whole directory.
+    assert shared == ['']
+
+
+def test_changed_directory_is_searched_again(shared, template_dir):
+    tuple(inventory.get_templates())
+    template_dir.join('new.html').ensure(file=True)
+    # some filesystems only keep the modification time to the second.
+    os.utime(str(template_dir), (time.time() + 2, time.time() + 2))
+    another_process()
+    assert 'new.html' in tuple(inventory.get_templates())
+    assert shared == ['', '']
+
+
+def test_choices_are_shared(shared, builds):
+    first = choices_cache.get_choices('^myapp/.+$', fields.nice_display_name)
+    another_process()
+    second = choices_cache.get_choices('^myapp/.+$', fields.nice_display_name)
+    assert first == second == (('myapp/b.html', 'B'),
+                               ('myapp/layouts/c.html', 'C'))
+    assert len(builds) == 1
+    with translation.override('de'):
+        choices_cache.get_choices('^myapp/.+$', fields.nice_display_name)
+    assert len(builds) == 2
+
+
+def test_changed_display_names_are_not_shared(shared, builds):
+    with override_settings(TEMPLATESELECTOR_DISPLAY_NAMES={'myapp/b.html': 'Old'}):
+        choices = choices_cache.get_choices('^myapp/.+$', fields.nice_display_name)
+        assert ('myapp/b.html', 'Old') in choices
+    another_process()
+    with override_settings(TEMPLATESELECTOR_DISPLAY_NAMES={'myapp/b.html': 'New'}):
+        choices = choices_cache.get_choices('^myapp/.+$', fields.nice_display_name)
+        assert ('myapp/b.html', 'New') in choices
+    assert len(builds) == 2
+
+
+def test_unimportable_display_names_are_not_shared(shared, builds):
+    display_name = lambda name: name.upper()
+    choices_cache.get_choices('^myapp/.+$', display_name)
+    another_process()
+    choices_cache.get_choices('^myapp/.+$', display_name)
+    assert len(builds) == 2
+
+
+def test_refresh_replaces_shared_listing(shared, template_dir):
+    tuple(inventory.get_templates())
+    choices_cache.get_choices('^myapp/.+$', fields.nice_display_name)
+    # too deep to change the fingerprint.
+    template_dir.join('myapp', 'layouts', 'deep', 'd.html').ensure(file=True)
+    with override_settings(TEMPLATESELECTOR_REFRESH_AFTER=0):
+        tuple(inventory.get_templates())
+        for thread in threading.enumerate():
+            if thread.name == 'templateselector-refresh':
+                thread.join()
+    assert 'myapp/layouts/deep/d.html' in tuple(inventory.get_templates())
+    another_process()
+    assert 'myapp/layouts/deep/d.html' in tuple(inventory.get_templates())
+    choices = choices_cache.get_choices('^myapp/.+$', fields.nice_display_name)
+    assert ('myapp/layouts/deep/d.html', 'D') in choices
+
+
+def test_applied_changes_replace_shared_listing(shared):
+    tuple(inventory.get_templates())
+    key = inventory.get_key(inventory_module.engines['django'])
+    assert inventory.apply_changes(key, added=['myapp/layouts/deep/d.html'])
+    another_process()
+    assert 'myapp/layouts/deep/d.html' in tuple(inventory.get_templates())
+    assert shared == ['']
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+from contextlib import contextmanager
+
+import pytest
+from django.template import TemplateDoesNotExist
+from django.test import override_settings
+
+from templateselector import fields, handlers
+from templateselector.fields import (TemplateChoiceField, choices_cache,
+                                     get_templates_from_loaders)
+from templateselector.inventory import TemplateInventory, inventory
+from templateselector.loading import MissingTemplateCache, load_template
+from templateselector.signals import (cache_lookup, choices_built,
+                                      templates_scanned, widget_rendered)
+
+
+@contextmanager
+def received(signal):
+    calls = []
+    def receiver(sender, **kwargs):
+        kwargs['sender'] = sender
+        calls.append(kwargs)
+    signal.connect(receiver)
+    try:
+        yield calls
+    finally:
+        signal.disconnect(receiver)
+
+
+@pytest.yield_fixture
+def cold():
+    inventory.clear()
+    choices_cache.clear()
+    yield
+    inventory.clear()
+    choices_cache.clear()
+
+
+def test_nothing_is_timed_without_listeners(cold, monkeypatch):
+    def explode():
+        raise AssertionError("Shouldn't have timed anything")
+    monkeypatch.setattr(fields, 'default_timer', explode)
+    monkeypatch.setattr(handlers, 'default_timer', explode)
+    field = TemplateChoiceField(match="^admin/[0-9]+.html$")
+    field.widget.render('template', None)
+
+
+def test_templates_scanned(cold):
+    with received(templates_scanned) as calls:
+        results = tuple(get_templates_from_loaders())
+    assert len(calls) > 1
+    assert sum(x['files'] for x in calls) >= len(results)
+    assert all(x['duration'] >= 0 and x['prefix'] == '' for x in calls)
+    assert all(x['directory'] is not None for x in calls)
+
+
+def test_templates_scanned_with_threads(cold):
+    with override_settings(TEMPLATESELECTOR_SCAN_WORKERS=4):
+        with received(templates_scanned) as calls:
+            tuple(get_templates_from_loaders(prefix='admin/'))
+    assert {x['directory'] for x in calls} == {None}
+    assert sum(x['files'] for x in calls) > 0
+
+
+def test_choices_built(cold):
+    with received(choices_built) as calls:
+        field = TemplateChoiceField(match="^admin/[0-9]+.html$")
+        tuple(field.choices)
+    assert len(calls) == 1
+    call = calls[0]
+    assert call['sender'] is TemplateChoiceField
+    assert call['match'] == "^admin/[0-9]+.html$"
+    assert call['matched'] == 2
+    assert call['scanned'] > call['matched']
+    for phase in ('listing', 'filter', 'display_name', 'sort'):
+        assert call['{}_duration'.format(phase)] >= 0
+
+
+def test_widget_rendered(cold):
+    field = TemplateChoiceField(match="^admin/[0-9]+.html$")
+    with received(widget_rendered) as calls:
+        html = field.widget.render('template', 'admin/404.html')
+    assert 'admin/404.html' in html
+    assert len(calls) == 1
+    assert calls[0]['options'] == 2
+    assert calls[0]['name'] == 'template'
+
+
+def test_cache_lookups(cold):
+    with received(cache_lookup) as calls:
+        choices_cache.get_choices("^admin/[0-9]+.html$", fields.nice_display_name)
+        choices_cache.get_choices("^admin/[0-9]+.html$", fields.nice_display_name)
+    lookups = [(x['sender'], x['hit']) for x in calls]
+    assert lookups == [
+        (fields.ChoicesCache, False),
+        (TemplateInventory, False),
+        (fields.ChoicesCache, True),
+    ]
+
+
+@override_settings(TEMPLATESELECTOR_MISSING_TEMPLATES_TIMEOUT=None)
+def test_missing_template_lookups():
+    with received(cache_lookup) as calls:
+        for attempt in range(2):
+            with pytest.raises(TemplateDoesNotExist):
+                load_template('admin/in2dex.html')
+    assert [(x['sender'], x['hit']) for x in calls] == [
+        (MissingTemplateCache, False),
+        (MissingTemplateCache, True),
+    ]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import pytest
+from django.forms import Form, modelform_factory
+from django.test import override_settings
+
+from templateselector.fields import (TemplateChoiceField, choices_cache,
+                                     get_templates_from_loaders)
+from templateselector.inventory import inventory
+from templateselector.testing import (assertNumTemplateCompiles,
+                                      assertNumTemplateScans)
+
+
+@pytest.yield_fixture
+def cold():
+    inventory.clear()
+    choices_cache.clear()
+    yield
+    inventory.clear()
+    choices_cache.clear()
+
+
+class TwoFieldForm(Form):
+    a = TemplateChoiceField(match="^admin/[0-9]+.html$")
+    b = TemplateChoiceField(match="^admin/[0-9]+.html$")
+
+
+def test_counts_scans_per_loader(cold, template_scans):
+    tuple(get_templates_from_loaders(prefix='admin/'))
+    # the filesystem & app directories loaders.
+    assert template_scans.scans == 2
+    assert template_scans.prefixes == ['admin/', 'admin/']
+    assert template_scans.directories > 2
+
+
+def test_rendering_a_form_scans_once_per_loader(cold):
+    with assertNumTemplateScans(2):
+        TwoFieldForm().as_p()
+    with assertNumTemplateScans(0):
+        TwoFieldForm().as_p()
+
+
+def test_wrong_number_of_scans_fails(cold):
+    with pytest.raises(AssertionError) as exc:
+        with assertNumTemplateScans(0):
+            tuple(get_templates_from_loaders())
+    assert '2 template scans were made, 0 expected' in str(exc.value)
+
+
+def test_threaded_scans_are_counted(cold):
+    with override_settings(TEMPLATESELECTOR_SCAN_WORKERS=4):
+        with assertNumTemplateScans(2) as counter:
+            tuple(get_templates_from_loaders())
+    assert counter.directories > 2
+
+
+def test_model_instance_compiles_once():
+    from templateselector.tests.models import MyModel
+    instance = MyModel(f="admin/index.html")
+    with assertNumTemplateCompiles(1) as counter:
+        instance.get_f_instance()
+        instance.get_f_instance()
+    assert counter.names == ["admin/index.html"]
+
+
+def test_validation_compiles_once(cold):
+    from templateselector.tests.models import MyModel
+    Form = modelform_factory(MyModel, fields=['f'])
+    form = Form(data={'f': 'admin/index.html'})
+    with assertNumTemplateScans(2), assertNumTemplateCompiles(1):
+        assert form.is_valid()
+
+
+def test_wrong_number_of_compiles_fails():
+    from templateselector.tests.models import MyModel
+    with pytest.raises(AssertionError) as exc:
+        with assertNumTemplateCompiles(0):
+            MyModel(f="admin/index.html").get_f_instance()
+    assert "1 templates were loaded, 0 expected" in str(exc.value)
+    assert "admin/index.html" in str(exc.value)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+from django.apps import apps
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils.six import StringIO
+
+from templateselector import fields
+from templateselector.fields import TemplateChoiceField, nice_display_name
+from templateselector.warmup import get_patterns, warm_up
+
+
+def test_patterns_include_models_and_forms():
+    field = TemplateChoiceField(match="^admin/[0-9]+.html$")
+    patterns = list(get_patterns())
+    assert (r"^admin/.+\.html$", nice_display_name) in patterns
+    assert ("^admin/[0-9]+.html$", nice_display_name) in patterns
+    assert len(patterns) == len(set(patterns))
+    del field
+
+
+def test_choices_are_built(builds):
+    field = TemplateChoiceField(match="^admin/[0-9]+.html$")
+    results = warm_up()
+    assert {x['match'] for x in results} >= {r"^admin/.+\.html$",
+                                             "^admin/[0-9]+.html$"}
+    count = len(builds)
+    assert len(tuple(field.choices)) == 2
+    assert len(builds) == count
+
+
+def test_templates_are_compiled(builds, get_template_calls):
+    results = warm_up(patterns=[("^admin/[0-9]+.html$", nice_display_name)],
+                      compile=True)
+    assert sorted(get_template_calls) == ['admin/404.html', 'admin/500.html']
+    assert results[0]['compiled'] == 2
+    assert results[0]['errors'] == []
+    assert results[0]['compile_seconds'] >= 0
+
+
+def test_compiling_uses_the_choices(builds, get_template_calls, monkeypatch):
+    def explode(*args, **kwargs):
+        raise AssertionError("Shouldn't have looked for the templates again")
+    monkeypatch.setattr(fields, 'get_matching_templates', explode)
+    results = warm_up(patterns=[("^admin/[0-9]+.html$", nice_display_name)],
+                      compile=True)
+    assert results[0]['compiled'] == 2
+    assert len(builds) == 1
+
+
+def test_command_reports_timings(builds):
+    out = StringIO()
+    call_command('templateselector_warmup', stdout=out)
+    assert r'^admin/.+\.html$: ' in out.getvalue()
+    assert 'Warmed up ' in out.getvalue()
+    assert len(builds) >= 1
+
+
+def test_ready_warms_up(builds):
+    config = apps.get_app_config('templateselector')
+    config.ready()
+    assert builds == []
+    with override_settings(TEMPLATESELECTOR_WARMUP_ON_READY=True):
+        config.ready()
+        assert r"^admin/.+\.html$" in builds
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import os
+import time
+
+import pytest
+from django.test import override_settings
+
+from templateselector.inventory import inventory
+from templateselector.watcher import (INotify, InotifyBackend, PollingBackend,
+                                      TemplateWatcher)
+
+
+@pytest.fixture
+def template_dirs(tmpdir):
+    first = tmpdir.mkdir('first')
+    second = tmpdir.mkdir('second')
+    for path in ('a.html', 'myapp/b.html', 'myapp/layouts/c.html'):
+        first.join(*path.split('/')).ensure(file=True)
+    second.join('shared.html').ensure(file=True)
+    return first, second
+
+
+@pytest.yield_fixture(params=[PollingBackend, InotifyBackend])
+def watched(request, template_dirs, scans):
+    if request.param is InotifyBackend and INotify is None:
+        pytest.skip("needs inotify_simple")
+    templates = [{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [str(x) for x in template_dirs],
+    }]
+    with override_settings(TEMPLATES=templates):
+        watcher = TemplateWatcher(backend_class=request.param)
+        watcher.poll()
+        assert 'a.html' in tuple(inventory.get_templates())
+        yield watcher, template_dirs, scans
+        watcher.stop()
+    inventory.clear()
+
+
+def touch(directory, path):
+    directory.join(*path.split('/')).ensure(file=True)
+    # some filesystems only keep the modification time to the second.
+    os.utime(str(directory.join(*path.split('/')).dirpath()),
+             (time.time() + 2, time.time() + 2))
+
+
+def test_added_and_removed_templates(watched):
+    watcher, (first, second), scans = watched
+    version = inventory.version
+    touch(first, 'myapp/layouts/new.html')
+    first.join('a.html').remove()
+    assert watcher.poll() == 2
+    assert inventory.version == version + 1
+    results = tuple(inventory.get_templates())
+    assert 'myapp/layouts/new.html' in results
+    assert 'a.html' not in results
+    assert inventory.exists('myapp/layouts/new.html') is True
+    assert watcher.poll() == 0
+    assert inventory.version == version + 1
+    assert len(scans) == 1
+
+
+def test_renamed_directory(watched):
+    watcher, (first, second), scans = watched
+    first.join('myapp').rename(first.join('yourapp'))
+    os.utime(str(first), (time.time() + 2, time.time() + 2))
+    watcher.poll()
+    results = set(inventory.get_templates())
+    assert results == {'a.html', 'yourapp/b.html', 'yourapp/layouts/c.html',
+                       'shared.html'}
+    assert len(scans) == 1
+
+
+def test_prefixed_listings_are_updated(watched):
+    watcher, (first, second), scans = watched
+    assert tuple(inventory.get_templates(prefix='myapp/layouts/')) == (
+        'myapp/layouts/c.html',)
+    touch(first, 'myapp/layouts/d.html')
+    touch(first, 'other/e.html')
+    watcher.poll()
+    assert tuple(inventory.get_templates(prefix='myapp/layouts/')) == (
+        'myapp/layouts/c.html', 'myapp/layouts/d.html')
+
+
+def test_excluded_files_are_ignored(watched):
+    watcher, (first, second), scans = watched
+    with override_settings(TEMPLATESELECTOR_EXTENSIONS=('.html',)):
+        watcher.poll()
+        tuple(inventory.get_templates())
+        touch(first, 'node_modules/x.html')
+        touch(first, 'b.png')
+        touch(first, 'c.html')
+        assert watcher.poll() == 1
+        results = set(inventory.get_templates())
+    assert results == {'a.html', 'c.html', 'myapp/b.html',
+                       'myapp/layouts/c.html', 'shared.html'}
+
+
+def test_shadowed_template_is_kept(watched):
+    watcher, (first, second), scans = watched
+    touch(first, 'shared.html')
+    watcher.poll()
+    second.join('shared.html').remove()
+    os.utime(str(second), (time.time() + 4, time.time() + 4))
+    watcher.poll()
+    assert 'shared.html' in tuple(inventory.get_templates())
+    first.join('shared.html').remove()
+    os.utime(str(first), (time.time() + 4, time.time() + 4))
+    watcher.poll()
+    assert 'shared.html' not in tuple(inventory.get_templates())
+
+
+def test_background_thread(watched):
+    watcher, (first, second), scans = watched
+    watcher.start(interval=0.01)
+    touch(first, 'later.html')
+    for attempt in range(200):
+        if 'later.html' in tuple(inventory.get_templates()):
+            break
+        time.sleep(0.01)
+    watcher.stop()
+    assert 'later.html' in tuple(inventory.get_templates())
+    assert len(scans) == 1
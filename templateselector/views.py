@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse
+from templateselector.metrics import CONTENT_TYPE, metrics as collected, is_enabled
+
+
+__all__ = ['metrics']
+
+
+@staff_member_required
+def metrics(request):
+    """
+    The metrics collected by this process, for Prometheus to scrape.
+    """
+    if not is_enabled():
+        raise Http404("Set TEMPLATESELECTOR_METRICS = True to collect metrics")
+    return HttpResponse(collected.render(), content_type=CONTENT_TYPE)
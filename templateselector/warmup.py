@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Doing the work the first request to show a `TemplateField` or
+`TemplateChoiceField` would otherwise have to do (searching the template
+directories, working out display names and sorting them, and optionally
+compiling the templates) ahead of time, eg: before a worker accepts traffic.
+"""
+from __future__ import unicode_literals, absolute_import
+from timeit import default_timer
+from django.apps import apps
+from django.conf import settings
+from django.utils import translation
+from templateselector.fields import (TemplateField, choices_cache,
+                                     template_choice_fields)
+from templateselector.loading import load_template
+
+
+__all__ = ['get_patterns', 'warm_up']
+
+
+def get_patterns():
+    """
+    The distinct ``(match, display_name)`` pairs used by every `TemplateField`
+    on an installed model, and every `TemplateChoiceField` which currently
+    exists (eg: those declared on forms whose modules have been imported).
+    """
+    seen = set()
+    fields = []
+    for model in apps.get_models():
+        fields.extend(field for field in model._meta.get_fields()
+                      if isinstance(field, TemplateField))
+    fields.extend(list(template_choice_fields))
+    for field in fields:
+        pattern = (field.match, field.display_name)
+        if pattern not in seen:
+            seen.add(pattern)
+            yield pattern
+
+
+def warm_up(patterns=None, compile=False, languages=None):
+    """
+    Build the choices for every pattern (see `get_patterns`) in each of the
+    `languages` (by default, the LANGUAGE_CODE), and if `compile` is set, load
+    every template they match, so that they're compiled (and kept, if the
+    cached loader or TEMPLATESELECTOR_CACHE_COMPILED_TEMPLATES is used).
+
+    Returns a list of dictionaries describing what was done for each pattern,
+    and how long it took.
+    """
+    if patterns is None:
+        patterns = get_patterns()
+    if not languages:
+        languages = [settings.LANGUAGE_CODE]
+    results = []
+    for match, display_name in patterns:
+        started = default_timer()
+        for language in languages:
+            with translation.override(language):
+                choices = choices_cache.get_choices(match, display_name)
+        built = default_timer()
+        compiled = 0
+        errors = []
+        if compile:
+            for name, display in choices:
+                try:
+                    load_template(name)
+                except Exception as e:
+                    errors.append((name, e))
+                else:
+                    compiled += 1
+        finished = default_timer()
+        results.append({
+            'match': match,
+            'display_name': display_name,
+            'choices': len(choices),
+            'choices_seconds': built - started,
+            'compiled': compiled,
+            'compile_seconds': finished - built,
+            'errors': errors,
+        })
+    return results
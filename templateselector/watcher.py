@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+Keeps the template inventory up to date as templates are added, removed or
+renamed while the process is running, without searching every template
+directory again.
+
+Uses inotify (via the optional ``inotify_simple`` package) where it's
+available, and otherwise looks at the modification time of every directory
+each time it's polled.
+"""
+from __future__ import unicode_literals, absolute_import
+import logging
+import os
+from threading import Event, RLock, Thread
+from django.conf import settings
+from django.template import engines
+from templateselector.handlers import (scandir, get_walk_options,
+                                       get_directory_id,
+                                       get_template_directories)
+from templateselector.inventory import inventory as default_inventory
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # pragma: no cover
+    INotify = None
+
+
+__all__ = ['PollingBackend', 'InotifyBackend', 'TemplateWatcher', 'watcher']
+
+logger = logging.getLogger(__name__)
+
+
+class PollingBackend(object):
+    """
+    Remembers the files & directories within every directory below the
+    `roots`, and when polled, looks again at any directory whose modification
+    time has changed (which happens whenever something is added, removed or
+    renamed directly within it).
+
+    Changes are returned as ``(root, name, exists)`` tuples, where `name` is
+    relative to the `root`.
+    """
+    def __init__(self, roots, exclude_dirs=frozenset(), extensions=None,
+                 follow_symlinks=False):
+        self.exclude_dirs = exclude_dirs
+        self.extensions = extensions
+        self.follow_symlinks = follow_symlinks
+        # directory -> (root, modified time, files, subdirectories)
+        self.directories = {}
+        self.directory_ids = {}
+        self.seen_ids = set()
+        for root in roots:
+            self.add_directory(root, root, changes=[])
+
+    def watch(self, path):
+        pass
+
+    def unwatch(self, path):
+        pass
+
+    def close(self):
+        pass
+
+    def read_directory(self, path):
+        # Taken before looking inside, so anything changing while looking is
+        # found next time.
+        modified = os.stat(path).st_mtime
+        files = set()
+        subdirectories = set()
+        for item in scandir(path):
+            if item.is_dir(follow_symlinks=self.follow_symlinks):
+                if item.name not in self.exclude_dirs:
+                    subdirectories.add(item.name)
+            elif self.extensions is not None and not item.name.endswith(self.extensions):
+                continue
+            elif item.is_file():
+                files.add(item.name)
+        return modified, frozenset(files), frozenset(subdirectories)
+
+    def get_name(self, root, path, filename):
+        return os.path.join(path, filename)[len(root)+1:]
+
+    def add_directory(self, root, path, changes):
+        stack = [path]
+        while stack:
+            path = stack.pop()
+            if self.follow_symlinks:
+                try:
+                    directory_id = get_directory_id(path)
+                except OSError:
+                    continue
+                if directory_id in self.seen_ids:
+                    continue
+                self.seen_ids.add(directory_id)
+                self.directory_ids[path] = directory_id
+            try:
+                modified, files, subdirectories = self.read_directory(path)
+            except OSError:
+                self.seen_ids.discard(self.directory_ids.pop(path, None))
+                continue
+            self.directories[path] = (root, modified, files, subdirectories)
+            self.watch(path)
+            for filename in files:
+                changes.append((root, self.get_name(root, path, filename), True))
+            for dirname in subdirectories:
+                stack.append(os.path.join(path, dirname))
+
+    def remove_directory(self, path, changes):
+        stack = [path]
+        while stack:
+            path = stack.pop()
+            entry = self.directories.pop(path, None)
+            if entry is None:
+                continue
+            self.seen_ids.discard(self.directory_ids.pop(path, None))
+            self.unwatch(path)
+            root, modified, files, subdirectories = entry
+            for filename in files:
+                changes.append((root, self.get_name(root, path, filename), False))
+            for dirname in subdirectories:
+                stack.append(os.path.join(path, dirname))
+
+    def refresh_directory(self, path, changes):
+        entry = self.directories.get(path)
+        if entry is None:
+            return None
+        root, old_modified, old_files, old_subdirectories = entry
+        try:
+            modified, files, subdirectories = self.read_directory(path)
+        except OSError:
+            self.remove_directory(path, changes)
+            return None
+        self.directories[path] = (root, modified, files, subdirectories)
+        for filename in files - old_files:
+            changes.append((root, self.get_name(root, path, filename), True))
+        for filename in old_files - files:
+            changes.append((root, self.get_name(root, path, filename), False))
+        for dirname in old_subdirectories - subdirectories:
+            self.remove_directory(os.path.join(path, dirname), changes)
+        for dirname in subdirectories - old_subdirectories:
+            self.add_directory(root, os.path.join(path, dirname), changes)
+
+    def has_changed(self, path):
+        try:
+            modified = os.stat(path).st_mtime
+        except OSError:
+            return True
+        return modified != self.directories[path][1]
+
+    def get_changed_directories(self):
+        return [path for path in self.directories if self.has_changed(path)]
+
+    def poll(self):
+        changes = []
+        for path in self.get_changed_directories():
+            self.refresh_directory(path, changes)
+        return changes
+
+
+class InotifyBackend(PollingBackend):
+    """
+    Asks the kernel which directories have had something added, removed or
+    renamed within them, rather than looking at all of them. Any directory
+    which couldn't be watched (eg: because there's a limit on the number of
+    watches) is still checked by modification time.
+    """
+    def __init__(self, *args, **kwargs):
+        if INotify is None:
+            raise ImportError("Watching template directories using inotify "
+                              "requires `pip install inotify_simple`")
+        self.inotify = INotify()
+        self.mask = (inotify_flags.CREATE | inotify_flags.DELETE |
+                     inotify_flags.MOVED_FROM | inotify_flags.MOVED_TO |
+                     inotify_flags.DELETE_SELF | inotify_flags.ONLYDIR)
+        self.watches = {}
+        self.descriptors = {}
+        super(InotifyBackend, self).__init__(*args, **kwargs)
+
+    def watch(self, path):
+        try:
+            descriptor = self.inotify.add_watch(path, self.mask)
+        except OSError:
+            return None
+        # A directory which has been moved keeps the same descriptor.
+        self.watches[descriptor] = path
+        self.descriptors[path] = descriptor
+
+    def unwatch(self, path):
+        descriptor = self.descriptors.pop(path, None)
+        if descriptor is None or self.watches.get(descriptor) != path:
+            return None
+        del self.watches[descriptor]
+        try:
+            self.inotify.rm_watch(descriptor)
+        except OSError:
+            pass
+
+    def close(self):
+        self.inotify.close()
+
+    def get_changed_directories(self):
+        changed = set()
+        for event in self.inotify.read(timeout=0):
+            if event.mask & inotify_flags.Q_OVERFLOW:
+                return list(self.directories)
+            path = self.watches.get(event.wd)
+            if path is not None and path in self.directories:
+                changed.add(path)
+        changed.update(path for path in self.directories
+                       if path not in self.descriptors and self.has_changed(path))
+        return list(changed)
+
+
+class TemplateWatcher(object):
+    """
+    Watches the directories `from_filesystem` would search for every engine,
+    and applies any templates added, removed or renamed within them to the
+    listings already in the `inventory`, changing its `version`.
+
+    Call `poll` to apply any changes since it was last called, or `start` to
+    do so every TEMPLATESELECTOR_WATCH_INTERVAL seconds in a background thread.
+    """
+    def __init__(self, inventory=default_inventory, backend_class=None):
+        self.inventory = inventory
+        self.backend_class = backend_class
+        self.backend = None
+        self.roots = {}
+        self.options = {}
+        self._lock = RLock()
+        self._stop = Event()
+        self._thread = None
+
+    def get_backend_class(self):
+        if self.backend_class is not None:
+            return self.backend_class
+        if INotify is None:
+            return PollingBackend
+        return InotifyBackend
+
+    def get_roots(self):
+        roots = {}
+        for engine in engines.all():
+            if not hasattr(engine, 'engine'):
+                continue
+            key = self.inventory.get_key(engine)
+            loaders = engine.engine.template_loaders
+            for directory in get_template_directories(loaders):
+                roots.setdefault(directory, []).append(key)
+        return roots
+
+    def setup(self, roots=None, options=None):
+        with self._lock:
+            self.reset()
+            self.roots = self.get_roots() if roots is None else roots
+            self.options = get_walk_options() if options is None else options
+            backend_class = self.get_backend_class()
+            self.backend = backend_class(self.roots, **self.options)
+
+    def reset(self):
+        with self._lock:
+            if self.backend is not None:
+                self.backend.close()
+            self.backend = None
+
+    def exists_elsewhere(self, key, root, name):
+        for other, keys in self.roots.items():
+            if other != root and key in keys:
+                if os.path.isfile(os.path.join(other, name)):
+                    return True
+        return False
+
+    def poll(self):
+        """
+        Apply any changes since the last poll (or since the watcher was set
+        up) to the inventory, returning how many there were.
+
+        If the template directories or TEMPLATESELECTOR_* walk settings have
+        changed, it starts watching again from scratch instead.
+        """
+        with self._lock:
+            roots = self.get_roots()
+            options = get_walk_options()
+            if (self.backend is None or roots != self.roots or
+                    options != self.options):
+                self.setup(roots=roots, options=options)
+                return 0
+            changes = self.backend.poll()
+            added = {}
+            removed = {}
+            for root, name, exists in changes:
+                for key in self.roots.get(root, ()):
+                    if exists:
+                        added.setdefault(key, set()).add(name)
+                    elif not self.exists_elsewhere(key, root, name):
+                        removed.setdefault(key, set()).add(name)
+            for key in set(added) | set(removed):
+                self.inventory.apply_changes(key, added=added.get(key, ()),
+                                             removed=removed.get(key, ()))
+            return len(changes)
+
+    def run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Couldn't check the template directories "
+                                 "for changes")
+
+    def start(self, interval=None):
+        if interval is None:
+            interval = getattr(settings, 'TEMPLATESELECTOR_WATCH_INTERVAL', 1.0)
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self._thread
+            if self.backend is None:
+                self.setup()
+            self._stop.clear()
+            thread = Thread(target=self.run, args=(interval,),
+                            name='templateselector-watcher')
+            thread.daemon = True
+            thread.start()
+            self._thread = thread
+        return thread
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+        self._thread = None
+        self.reset()
+
+
+watcher = TemplateWatcher()
+
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, absolute_import
+from timeit import default_timer
 from django.forms import RadioSelect
+from templateselector.signals import widget_rendered, has_listeners
 
 
 __all__ = ['TemplateSelector', 'AdminTemplateSelector']
@@ -16,6 +18,20 @@ class TemplateSelector(RadioSelect):
             'all': ('templateselector/widget.css',)
         }
 
+    def render(self, name, value, attrs=None, renderer=None):
+        if not has_listeners(widget_rendered):
+            return super(TemplateSelector, self).render(name, value, attrs=attrs,
+                                                        renderer=renderer)
+        started = default_timer()
+        context = self.get_context(name, value, attrs)
+        prepared = default_timer()
+        html = self._render(self.template_name, context, renderer)
+        options = sum(len(group[1]) for group in context['widget']['optgroups'])
+        widget_rendered.send(sender=self.__class__, widget=self, name=name,
+                             options=options, context_duration=prepared - started,
+                             render_duration=default_timer() - prepared)
+        return html
+
 
 class AdminTemplateSelector(TemplateSelector):
     def __init__(self, attrs=None):